@@ -0,0 +1,195 @@
+"""Local stand-ins for the Gemini SDK and Discord objects used by the benchmarks"""
+import asyncio
+import json
+import random
+import re
+import time
+import zlib
+from typing import List, Optional
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+_CURRENT_MESSAGE = re.compile(r'Current (?:User )?[Mm]essage: (.*)')
+
+class FakeUsage:
+    def __init__(self, prompt: str, text: str):
+        self.prompt_token_count = len(prompt) // 4
+        self.candidates_token_count = len(text) // 4
+
+class FakeResponse:
+    def __init__(self, prompt: str, text: str):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt, text)
+
+class FakeStream:
+    """Async iterable of response chunks, spread over the configured latency"""
+
+    def __init__(self, prompt: str, text: str, delay: float, chunks: int = 8):
+        size = max(1, len(text) // chunks)
+        self._parts = [text[i:i + size] for i in range(0, len(text), size)]
+        self._delay = delay / max(1, len(self._parts))
+        self.usage_metadata = FakeUsage(prompt, text)
+
+    async def __aiter__(self):
+        for part in self._parts:
+            await asyncio.sleep(self._delay)
+            yield FakeResponse('', part)
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel answering each pipeline prompt after a simulated delay.
+
+    Latency, jitter and failure rate are class attributes so every model the
+    bot creates shares one configuration and one call counter.
+    """
+
+    latency = 0.5
+    jitter = 0.2
+    failure_rate = 0.0
+    light_factor = 0.4  # Latency of light-tier models ('...-lite') relative to the rest
+    result_chars = 1500
+    answer_chars = 800
+    calls = 0
+    rng = random.Random(0)
+
+    def __init__(self, model_name: str = None, generation_config=None, **kwargs):
+        self.model_name = model_name
+        self.generation_config = generation_config
+
+    @classmethod
+    def configure(cls, latency: float = None, jitter: float = None,
+                  failure_rate: float = None, seed: int = 0):
+        if latency is not None:
+            cls.latency = latency
+        if jitter is not None:
+            cls.jitter = jitter
+        if failure_rate is not None:
+            cls.failure_rate = failure_rate
+        cls.calls = 0
+        cls.rng = random.Random(seed)
+
+    def _delay(self) -> float:
+        latency = self.latency
+        if self.model_name and 'lite' in self.model_name:
+            latency *= self.light_factor
+        spread = latency * self.jitter
+        return max(0.0, latency + self.rng.uniform(-spread, spread))
+
+    @staticmethod
+    def _filler(seed: str, chars: int) -> str:
+        words = [f"{seed}{i}" for i in range(chars // 8)]
+        paragraphs = [' '.join(words[i:i + 20]) + '.' for i in range(0, len(words), 20)]
+        return '\n\n'.join(paragraphs)[:chars]
+
+    def _answer(self, prompt: str, generation_config) -> str:
+        match = _CURRENT_MESSAGE.search(prompt)
+        message = match.group(1).strip() if match else prompt[:80]
+        tag = format(zlib.crc32(message.encode('utf-8')), 'x')
+
+        if (generation_config or {}).get('response_mime_type') == 'application/json':
+            return json.dumps({'searches': [
+                {'query': f"{message} {suffix}", 'results': self._filler(tag, self.result_chars)}
+                for suffix in ('overview', 'latest')
+            ]})
+        if 'extract 1-3' in prompt:
+            return f"{message} overview\n{message} latest"
+        if 'act as a web search engine' in prompt:
+            return self._filler(tag, self.result_chars)
+        if 'running summary' in prompt:
+            return self._filler('summary', self.answer_chars // 2)
+        return self._filler('answer', self.answer_chars)
+
+    async def generate_content_async(self, prompt, generation_config=None, stream: bool = False, **kwargs):
+        FakeGenerativeModel.calls += 1
+        delay = self._delay()
+        text = self._answer(prompt, generation_config)
+        if stream:
+            await asyncio.sleep(delay / 4)  # Time to first chunk
+            return FakeStream(prompt, text, delay * 3 / 4)
+
+        await asyncio.sleep(delay)
+        if self.rng.random() < self.failure_rate:
+            raise google_exceptions.ServiceUnavailable("Simulated Gemini failure")
+        return FakeResponse(prompt, text)
+
+def install_fake_gemini():
+    """Route every genai.GenerativeModel created from now on to the fake"""
+    genai.GenerativeModel = FakeGenerativeModel
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str = None, bot: bool = False):
+        self.id = user_id
+        self.name = name or f"user{user_id}"
+        self.display_name = self.name
+        self.bot = bot
+        self.mention = f"<@{user_id}>"
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.filesize_limit = 8 * 1024 * 1024
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class FakeChannel:
+    """Text channel whose sends take `send_latency` seconds"""
+
+    def __init__(self, channel_id: int, guild: Optional[FakeGuild], send_latency: float = 0.05):
+        self.id = channel_id
+        self.guild = guild
+        self.send_latency = send_latency
+        self.sent: List["FakeMessage"] = []
+        self._next_id = channel_id * 1_000_000
+
+    def typing(self):
+        return _Typing()
+
+    async def send(self, content: str = None, **kwargs) -> "FakeMessage":
+        await asyncio.sleep(self.send_latency)
+        self._next_id += 1
+        message = FakeMessage(self._next_id, content or '', BOT_USER, self)
+        message.embeds = kwargs.get('embeds') or ([kwargs['embed']] if kwargs.get('embed') else [])
+        self.sent.append(message)
+        return message
+
+class FakeMessage:
+    """Incoming message; `replied` is set when the bot first replies to it"""
+
+    def __init__(self, message_id: int, content: str, author: FakeUser, channel: FakeChannel):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.embeds = []
+        self.created = time.perf_counter()
+        self.replies: List[FakeMessage] = []
+        self.edits = 0
+        self._state = None
+        self._replied: Optional[asyncio.Event] = None
+
+    @property
+    def replied(self) -> asyncio.Event:
+        if self._replied is None:
+            self._replied = asyncio.Event()
+        return self._replied
+
+    async def reply(self, content: str = None, **kwargs) -> "FakeMessage":
+        message = await self.channel.send(content, **kwargs)
+        self.replies.append(message)
+        self.replied.set()
+        return message
+
+    async def edit(self, content: str = None, **kwargs) -> "FakeMessage":
+        await asyncio.sleep(self.channel.send_latency)
+        if content is not None:
+            self.content = content
+        self.edits += 1
+        return self
+
+BOT_USER = FakeUser(1, name='benchmark-bot', bot=True)
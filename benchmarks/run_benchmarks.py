@@ -0,0 +1,267 @@
+"""Offline benchmarks for the message pipeline, conversation storage and the bot's on_message path.
+
+Gemini and Discord are replaced by local fakes with configurable latency, so
+runs cost no API quota and need no tokens. Each case runs in its own process
+so peak RSS is measured per case. Results are printed as JSON.
+
+    python -m benchmarks.run_benchmarks --scenario all --concurrency 1,8,32 --db-rows 0,100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# Settings read by Config at import time; callers may still override them
+os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
+os.environ.setdefault('DEBOUNCE_SECONDS', '0')
+os.environ.setdefault('STREAM_RESPONSES', 'false')
+os.environ.setdefault('GEMINI_RPM', '0')
+os.environ.setdefault('METRICS_PORT', '0')
+os.environ.setdefault('MAINTENANCE_INTERVAL_HOURS', '0')
+os.environ.pop('CHANNEL_ID', None)
+
+from benchmarks.fakes import (BOT_USER, FakeChannel, FakeGenerativeModel, FakeGuild,
+                              FakeMessage, FakeUser, install_fake_gemini)
+
+install_fake_gemini()
+
+from config import Config
+from conversation_memory import ConversationMemory
+
+SCENARIOS = ('pipeline', 'memory', 'bot')
+
+TOPICS = [
+    "the latest Python release", "SQLite WAL mode", "Discord rate limits", "electric car batteries",
+    "the James Webb telescope", "sourdough starters", "Rust async runtimes", "東京の天気",
+    "Kubernetes autoscaling", "the history of the printing press", "solar panel efficiency",
+]
+
+def make_message(index: int) -> str:
+    """A distinct, realistic-looking question so caches don't short-circuit the run"""
+    topic = TOPICS[index % len(TOPICS)]
+    return f"Can you tell me what is new with {topic}? I'm asking for case #{index}."
+
+def percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def summarize(latencies: List[float], elapsed: float, **extra) -> Dict:
+    ordered = sorted(latencies)
+    return dict(
+        extra,
+        completed=len(ordered),
+        p50_ms=round(percentile(ordered, 50) * 1000, 2),
+        p95_ms=round(percentile(ordered, 95) * 1000, 2),
+        p99_ms=round(percentile(ordered, 99) * 1000, 2),
+        msgs_per_sec=round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        elapsed_s=round(elapsed, 3),
+        model_calls=FakeGenerativeModel.calls,
+        # ru_maxrss is in kilobytes on Linux
+        peak_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    )
+
+async def run_concurrently(count: int, concurrency: int, fn) -> List[float]:
+    """Call fn(i) for i in range(count), at most `concurrency` at a time; return latencies"""
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        async with semaphore:
+            started = time.perf_counter()
+            if await fn(index) is not False:
+                latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return latencies
+
+def seed_conversations(memory: ConversationMemory, rows: int, channels: int, users: int):
+    """Bulk-insert `rows` synthetic conversations spread over the past 30 days"""
+    if rows <= 0:
+        return
+    rng = random.Random(1)
+    now = int(time.time())
+    batch = []
+    for i in range(rows):
+        batch.append((
+            str(rng.randrange(users)), str(rng.randrange(channels)),
+            make_message(i), "An answer " * 20, f"query {i}", now - rng.randrange(30 * 86400)
+        ))
+        if len(batch) == 5000 or i == rows - 1:
+            memory.storage.submit_write(lambda conn, batch=batch: conn.executemany(
+                "INSERT INTO conversations (user_id, channel_id, message, response, search_query, ts) "
+                "VALUES (?, ?, ?, ?, ?, ?)", batch
+            )).result()
+            batch = []
+
+async def bench_pipeline(args, db_path: str) -> Dict:
+    """GeminiSearchBot.process_message end to end, without Discord"""
+    from gemini_search import GeminiSearchBot
+
+    memory = ConversationMemory(db_path)
+    gemini = GeminiSearchBot('benchmark', storage=memory.storage)
+    try:
+        async def one(index: int):
+            await gemini.process_message(make_message(index), [])
+
+        started = time.perf_counter()
+        latencies = await run_concurrently(args.messages, args.concurrency, one)
+        return summarize(latencies, time.perf_counter() - started,
+                         pipeline=gemini.pipeline_stats.summary())
+    finally:
+        memory.close()
+
+async def bench_memory(args, db_path: str) -> Dict:
+    """A context read plus a conversation write per message, against a pre-filled database"""
+    memory = ConversationMemory(db_path)
+    seed_conversations(memory, args.db_rows, args.channels, args.users)
+    rng = random.Random(2)
+    try:
+        async def one(index: int):
+            user, channel = str(rng.randrange(args.users)), str(rng.randrange(args.channels))
+            await memory.get_recent_context(user, channel, hours=24, limit=5)
+            await memory.add_conversation(user, channel, make_message(index), "An answer", "query")
+
+        started = time.perf_counter()
+        latencies = await run_concurrently(args.messages, args.concurrency, one)
+        return summarize(latencies, time.perf_counter() - started,
+                         context_cache=memory.context_cache.get_stats(),
+                         commits=memory.storage.commits)
+    finally:
+        memory.close()
+
+async def bench_bot(args, db_path: str) -> Dict:
+    """GeminiDiscordBot.on_message for messages in a monitored channel, until each is answered"""
+    from discord_bot import setup_bot
+
+    Config.DATABASE_PATH = db_path
+    Config.VECTOR_INDEX_DIR = os.path.join(os.path.dirname(db_path), 'vector_index')
+    bot = setup_bot()
+    bot._connection.user = BOT_USER
+    seed_conversations(bot.memory, args.db_rows, args.channels, args.users)
+    # What login() does before setup_hook; AutoShardedBot.close() needs its event queue
+    await bot._async_setup_hook()
+    await bot.setup_hook()
+
+    guilds = [FakeGuild(1000 + g) for g in range(max(1, args.channels // 4))]
+    channels = [FakeChannel(2000 + c, guilds[c % len(guilds)], send_latency=args.send_latency)
+                for c in range(args.channels)]
+    for channel in channels:
+        bot.monitored_channels.seed(channel.id)
+    rng = random.Random(3)
+    dropped = 0
+
+    try:
+        async def one(index: int):
+            nonlocal dropped
+            channel = channels[rng.randrange(len(channels))]
+            author = FakeUser(10_000 + rng.randrange(args.users))
+            message = FakeMessage(index + 1, make_message(index), author, channel)
+            await bot.on_message(message)
+            try:
+                await asyncio.wait_for(message.replied.wait(), timeout=args.reply_timeout)
+            except asyncio.TimeoutError:
+                dropped += 1  # Shed by the scheduler under overload
+                return False
+
+        started = time.perf_counter()
+        latencies = await run_concurrently(args.messages, args.concurrency, one)
+        return summarize(latencies, time.perf_counter() - started,
+                         dropped=dropped, scheduler=bot.scheduler.get_stats(),
+                         outbound=bot.outbound.get_stats())
+    finally:
+        await bot.close()
+
+RUNNERS = {'pipeline': bench_pipeline, 'memory': bench_memory, 'bot': bench_bot}
+
+def run_case(args) -> Dict:
+    FakeGenerativeModel.configure(latency=args.latency, jitter=args.jitter,
+                                  failure_rate=args.failure_rate, seed=args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        result = asyncio.run(RUNNERS[args.scenario](args, os.path.join(tmp, 'bench.db')))
+    return dict({
+        'scenario': args.scenario,
+        'concurrency': args.concurrency,
+        'db_rows': args.db_rows,
+        'messages': args.messages,
+    }, **result)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scenario', default='all', choices=SCENARIOS + ('all',))
+    parser.add_argument('--concurrency', default='1,8,32', help="comma-separated in-flight message counts")
+    parser.add_argument('--db-rows', default='0', help="comma-separated database sizes to pre-fill")
+    parser.add_argument('--messages', type=int, default=200, help="messages per case")
+    parser.add_argument('--channels', type=int, default=8)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.5, help="mean fake Gemini latency (s)")
+    parser.add_argument('--jitter', type=float, default=0.2, help="latency spread as a fraction of the mean")
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--send-latency', type=float, default=0.05, help="fake Discord send latency (s)")
+    parser.add_argument('--reply-timeout', type=float, default=120.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="also write the JSON report to this file")
+    parser.add_argument('--in-process', action='store_true',
+                        help="run every case in this process (peak RSS then accumulates)")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.case:
+        # Child process: run exactly one case and print its result
+        for key, value in json.loads(args.case).items():
+            setattr(args, key, value)
+        print(json.dumps(run_case(args)))
+        return
+
+    scenarios = SCENARIOS if args.scenario == 'all' else (args.scenario,)
+    cases = [
+        {'scenario': scenario, 'concurrency': int(concurrency), 'db_rows': int(rows)}
+        for scenario in scenarios
+        for rows in args.db_rows.split(',')
+        for concurrency in args.concurrency.split(',')
+    ]
+
+    results = []
+    for case in cases:
+        print(f"Running {case['scenario']} concurrency={case['concurrency']} db_rows={case['db_rows']}...",
+              file=sys.stderr)
+        if args.in_process:
+            for key, value in case.items():
+                setattr(args, key, value)
+            results.append(run_case(args))
+            continue
+
+        # The child ignores --output; only the parent writes the report
+        child_argv = argv if argv is not None else sys.argv[1:]
+        proc = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.run_benchmarks', *child_argv, '--case', json.dumps(case)],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            results.append(dict(case, error=proc.stderr.strip().splitlines()[-1:]))
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    report = json.dumps({
+        'settings': {k: v for k, v in vars(args).items() if k not in ('case', 'output')},
+        'results': results,
+    }, indent=2, ensure_ascii=False)
+    print(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
+
+if __name__ == '__main__':
+    main()
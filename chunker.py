@@ -0,0 +1,185 @@
+import re
+from collections import deque
+from typing import Deque, List, NamedTuple, Optional
+
+# Discord limits
+MESSAGE_LIMIT = 2000
+EMBED_DESCRIPTION_LIMIT = 4096
+EMBEDS_PER_MESSAGE = 10
+EMBED_TOTAL_LIMIT = 6000
+
+# Don't start an embed with less room than this; begin a new message instead
+MIN_EMBED_ROOM = 500
+
+_FENCE = re.compile(r'^\s*(`{3,}|~{3,})')
+_SENTENCE_END = re.compile(r'[.!?]+\s+|[。！？]+')
+_WORD_END = re.compile(r'\s+')
+
+# Where a chunk may end, best first
+_PARAGRAPH, _LINE, _SENTENCE, _WORD, _HARD = range(5)
+
+class _Unit(NamedTuple):
+    text: str
+    boundary: int          # Kind of break that follows this unit
+    fence: Optional[str]   # Opening fence line still open after this unit, if any
+
+def _units(text: str) -> Deque[_Unit]:
+    """Split text into lines, tagging each with the break after it and the fence state"""
+    units: Deque[_Unit] = deque()
+    fence = None
+    for line in text.splitlines(keepends=True):
+        match = _FENCE.match(line)
+        if match and (fence is None or line.strip().startswith(_FENCE.match(fence).group(1))):
+            if fence is None:
+                fence = line.strip()
+                units.append(_Unit(line, _HARD, fence))  # Never end a chunk on an opening fence
+            else:
+                fence = None
+                units.append(_Unit(line, _PARAGRAPH, None))
+            continue
+        boundary = _PARAGRAPH if not line.strip() else _LINE
+        units.append(_Unit(line, boundary, fence))
+    return units
+
+def _split_after(text: str, pattern: re.Pattern) -> List[str]:
+    """Split text after each match of pattern, keeping every character"""
+    parts, start = [], 0
+    for match in pattern.finditer(text):
+        if start < match.end() < len(text):
+            parts.append(text[start:match.end()])
+            start = match.end()
+    parts.append(text[start:])
+    return parts
+
+def _split_unit(unit: _Unit, budget: int) -> List[_Unit]:
+    """Break an over-long line into sentences, then words, then hard cuts"""
+    pieces: List[_Unit] = []
+    # Code has no sentences
+    sentences = [unit.text] if unit.fence else _split_after(unit.text, _SENTENCE_END)
+    for sentence in sentences:
+        if len(sentence) <= budget:
+            pieces.append(_Unit(sentence, _SENTENCE, unit.fence))
+            continue
+        for word in _split_after(sentence, _WORD_END):
+            if len(word) <= budget:
+                pieces.append(_Unit(word, _WORD, unit.fence))
+            else:
+                pieces.extend(_Unit(word[i:i + budget], _HARD, unit.fence)
+                              for i in range(0, len(word), budget))
+        pieces[-1] = pieces[-1]._replace(boundary=_SENTENCE)
+    # The last piece keeps whatever break followed the whole line
+    pieces[-1] = pieces[-1]._replace(boundary=unit.boundary)
+    return pieces
+
+def _closing(fence: Optional[str]) -> str:
+    return '\n' + _FENCE.match(fence).group(1) if fence else ''
+
+class MarkdownChunker:
+    """Cut markdown into pieces that each fit a size limit, in a single pass over the text.
+
+    Chunks end at the best available boundary (paragraph, line, sentence,
+    word) in the second half of the allowed size. A code block cut in two is
+    closed at the end of one chunk and re-opened, with its language, at the
+    start of the next.
+    """
+
+    def __init__(self, text: str):
+        self._units = _units(text)
+        self._fence: Optional[str] = None  # Fence open at the start of the next chunk
+        longest_fence = max((len(u.text) for u in self._units if u.boundary == _HARD), default=0)
+        self._overhead = 2 * (longest_fence + 1) + 8
+
+    def take(self, limit: int) -> Optional[str]:
+        """Return the next chunk of at most `limit` characters, or None when done"""
+        while self._units:
+            chunk = self._take(limit)
+            if chunk:
+                return chunk
+        return None
+
+    def rest(self) -> str:
+        """The text not yet taken, with any open code block re-opened"""
+        prefix = self._fence + '\n' if self._fence else ''
+        return prefix + ''.join(unit.text for unit in self._units)
+
+    def _take(self, limit: int) -> str:
+        prefix = self._fence + '\n' if self._fence else ''
+        budget = max(1, limit - self._overhead)
+        taken: List[_Unit] = []
+        size = len(prefix)
+
+        while self._units:
+            unit = self._units[0]
+            if not taken and not unit.text.strip() and unit.fence is None:
+                self._units.popleft()  # Drop blank lines at the start of a chunk
+                continue
+            if len(unit.text) > budget:
+                self._units.popleft()
+                self._units.extendleft(reversed(_split_unit(unit, budget)))
+                continue
+            if taken and size + len(unit.text) + len(_closing(unit.fence)) > limit:
+                self._cut(taken, limit, len(prefix))
+                break
+            taken.append(self._units.popleft())
+            size += len(unit.text)
+
+        if not taken:
+            return ''
+        end_fence = taken[-1].fence
+        self._fence = end_fence
+        body = ''.join(unit.text for unit in taken).rstrip()
+        return (prefix + body + _closing(end_fence)).strip('\n')
+
+    def _cut(self, taken: List[_Unit], limit: int, start: int):
+        """Move units after the best break point back onto the queue"""
+        offsets = []
+        size = start
+        for unit in taken:
+            size += len(unit.text)
+            offsets.append(size)
+
+        best = len(taken) - 1
+        for i in range(len(taken) - 2, -1, -1):
+            if offsets[i] < limit // 2:
+                break
+            if offsets[i] + len(_closing(taken[i].fence)) > limit:
+                continue
+            if taken[i].boundary < taken[best].boundary:
+                best = i
+        for unit in reversed(taken[best + 1:]):
+            self._units.appendleft(unit)
+        del taken[best + 1:]
+
+def chunk_markdown(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Split text into message-sized chunks at natural boundaries"""
+    chunker = MarkdownChunker(text)
+    chunks = []
+    while True:
+        chunk = chunker.take(limit)
+        if chunk is None:
+            return chunks
+        chunks.append(chunk)
+
+def pack_embeds(text: str, reserved: int = 0) -> List[List[str]]:
+    """Split text into embed descriptions grouped per message, using as few messages as possible.
+
+    `reserved` is the room already used in the first message by titles,
+    fields and footers, which count towards Discord's per-message total.
+    """
+    chunker = MarkdownChunker(text)
+    messages: List[List[str]] = []
+    current: List[str] = []
+    room = EMBED_TOTAL_LIMIT - reserved
+    while True:
+        if current and (len(current) == EMBEDS_PER_MESSAGE or room < MIN_EMBED_ROOM):
+            messages.append(current)
+            current = []
+            room = EMBED_TOTAL_LIMIT
+        chunk = chunker.take(min(EMBED_DESCRIPTION_LIMIT, room))
+        if chunk is None:
+            break
+        current.append(chunk)
+        room -= len(chunk)
+    if current:
+        messages.append(current)
+    return messages
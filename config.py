@@ -14,22 +14,85 @@ class Config:
     # Gemini API Configuration
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+    GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '4'))
+    GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '30'))
+    GEMINI_RPM = float(os.getenv('GEMINI_RPM', '60'))
+    GEMINI_RPM_BURST = float(os.getenv('GEMINI_RPM_BURST', '5'))
+    
+    # Resilience: jittered retries and hedged duplicates are each capped at a
+    # fraction of regular calls; the circuit breaker opens after consecutive failures
+    GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '2'))
+    RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '0.5'))
+    RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '4'))
+    RETRY_BUDGET = float(os.getenv('RETRY_BUDGET', '0.2'))
+    HEDGE_REQUESTS = os.getenv('HEDGE_REQUESTS', 'false').lower() == 'true'
+    HEDGE_BUDGET = float(os.getenv('HEDGE_BUDGET', '0.05'))
+    BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', '5'))
+    BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', '30'))
     
     # Bot Configuration
     COMMAND_PREFIX = os.getenv('COMMAND_PREFIX', '!')
     
+    # Sharding Configuration (SHARD_COUNT=0 asks Discord for the recommended count)
+    SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0'))
+    SHARD_PROCESSES = int(os.getenv('SHARD_PROCESSES', '1'))
+    
     # Search Configuration
     MAX_SEARCH_QUERIES = int(os.getenv('MAX_SEARCH_QUERIES', '3'))
     AUTO_SEARCH_MIN_LENGTH = int(os.getenv('AUTO_SEARCH_MIN_LENGTH', '10'))
+    DEBOUNCE_SECONDS = float(os.getenv('DEBOUNCE_SECONDS', '2.0'))
+    DEBOUNCE_MAX_BATCH = int(os.getenv('DEBOUNCE_MAX_BATCH', '5'))
+    PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'full')  # full, heuristic or combined
+    COALESCE_MESSAGES = os.getenv('COALESCE_MESSAGES', 'false').lower() == 'true'
+    SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '3600'))
+    SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '512'))
+    # Per-request latency budgets in seconds (0 waits for every search)
+    AUTO_SEARCH_BUDGET = float(os.getenv('AUTO_SEARCH_BUDGET', '25'))
+    MANUAL_SEARCH_BUDGET = float(os.getenv('MANUAL_SEARCH_BUDGET', '45'))
+    # Expired results are kept this long to answer while Gemini is unavailable
+    SEARCH_CACHE_STALE_SECONDS = int(os.getenv('SEARCH_CACHE_STALE_SECONDS', '86400'))
+    
+    # Scheduler Configuration
+    WORKER_COUNT = int(os.getenv('WORKER_COUNT', '4'))
+    MAX_QUEUE_SIZE = int(os.getenv('MAX_QUEUE_SIZE', '100'))
+    AUTO_SEARCH_STALE_SECONDS = float(os.getenv('AUTO_SEARCH_STALE_SECONDS', '60'))
     
     # Memory Configuration
     CONTEXT_HOURS = int(os.getenv('CONTEXT_HOURS', '24'))
     CONTEXT_LIMIT = int(os.getenv('CONTEXT_LIMIT', '5'))
     DATABASE_PATH = os.getenv('DATABASE_PATH', 'conversation_memory.db')
+    DATABASE_URL = os.getenv('DATABASE_URL', '')  # e.g. sqlite:////data/bot.db; overrides DATABASE_PATH
+    MONITOR_REFRESH_SECONDS = float(os.getenv('MONITOR_REFRESH_SECONDS', '30'))
+    CONTEXT_CACHE_PER_KEY = int(os.getenv('CONTEXT_CACHE_PER_KEY', '10'))
+    CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv('CONTEXT_CACHE_MAX_ENTRIES', '20000'))
+    
+    # Prompt Configuration (estimated tokens per prompt section)
+    CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '400'))
+    SEARCH_TOKEN_BUDGET = int(os.getenv('SEARCH_TOKEN_BUDGET', '2000'))
+    MESSAGE_TOKEN_BUDGET = int(os.getenv('MESSAGE_TOKEN_BUDGET', '500'))
+    
+    # Rolling Conversation Summaries (replace older raw turns in prompts)
+    SUMMARIES_ENABLED = os.getenv('SUMMARIES_ENABLED', 'true').lower() == 'true'
+    SUMMARY_TOKEN_BUDGET = int(os.getenv('SUMMARY_TOKEN_BUDGET', '300'))
+    SUMMARY_RECENT_TURNS = int(os.getenv('SUMMARY_RECENT_TURNS', '2'))
+    SUMMARY_BATCH_SIZE = int(os.getenv('SUMMARY_BATCH_SIZE', '20'))
+    
+    # Relevant Context Retrieval (local vector index of past exchanges; needs numpy)
+    VECTOR_INDEX_ENABLED = os.getenv('VECTOR_INDEX_ENABLED', 'true').lower() == 'true'
+    VECTOR_INDEX_DIR = os.getenv('VECTOR_INDEX_DIR', 'vector_index')  # One subdirectory per shard process
+    VECTOR_DIM = int(os.getenv('VECTOR_DIM', '256'))
+    RELEVANT_CONTEXT_K = int(os.getenv('RELEVANT_CONTEXT_K', '3'))
+    RELEVANT_TOKEN_BUDGET = int(os.getenv('RELEVANT_TOKEN_BUDGET', '300'))
+    RELEVANT_MIN_SCORE = float(os.getenv('RELEVANT_MIN_SCORE', '0.2'))
     
     # Response Configuration
     MAX_RESPONSE_LENGTH = int(os.getenv('MAX_RESPONSE_LENGTH', '2000'))
     CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', '1900'))
+    STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'true').lower() == 'true'
+    STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.5'))
+    # Local pacing per channel; Discord allows about 5 messages per 5 seconds
+    OUTBOUND_RATE_PER_MINUTE = float(os.getenv('OUTBOUND_RATE_PER_MINUTE', '60'))
+    OUTBOUND_BURST = int(os.getenv('OUTBOUND_BURST', '5'))
     
     # Gemini Generation Configuration
     TEMPERATURE = float(os.getenv('TEMPERATURE', '0.7'))
@@ -37,8 +100,37 @@ class Config:
     TOP_K = int(os.getenv('TOP_K', '40'))
     MAX_OUTPUT_TOKENS = int(os.getenv('MAX_OUTPUT_TOKENS', '2048'))
     
+    # Per-stage Model Routing: short extraction and search calls use the light tier,
+    # the final answer uses GEMINI_MODEL. Stages without an override use the values above.
+    PIPELINE_STAGES = ('extract', 'search', 'combined', 'generate', 'summarize')
+    GEMINI_LIGHT_MODEL = os.getenv('GEMINI_LIGHT_MODEL', 'gemini-2.5-flash-lite')
+    EXTRACT_MODEL = os.getenv('EXTRACT_MODEL', GEMINI_LIGHT_MODEL)
+    EXTRACT_MAX_TOKENS = int(os.getenv('EXTRACT_MAX_TOKENS', '256'))
+    EXTRACT_TEMPERATURE = float(os.getenv('EXTRACT_TEMPERATURE', '0.2'))
+    SEARCH_MODEL = os.getenv('SEARCH_MODEL', GEMINI_LIGHT_MODEL)
+    SEARCH_MAX_TOKENS = int(os.getenv('SEARCH_MAX_TOKENS', '1024'))
+    SEARCH_TEMPERATURE = float(os.getenv('SEARCH_TEMPERATURE', '0.4'))
+    COMBINED_MODEL = os.getenv('COMBINED_MODEL', GEMINI_LIGHT_MODEL)
+    COMBINED_TEMPERATURE = float(os.getenv('COMBINED_TEMPERATURE', '0.4'))
+    GENERATE_MODEL = os.getenv('GENERATE_MODEL', GEMINI_MODEL)
+    SUMMARIZE_MODEL = os.getenv('SUMMARIZE_MODEL', GEMINI_LIGHT_MODEL)
+    SUMMARIZE_MAX_TOKENS = int(os.getenv('SUMMARIZE_MAX_TOKENS', '512'))
+    SUMMARIZE_TEMPERATURE = float(os.getenv('SUMMARIZE_TEMPERATURE', '0.2'))
+    # Calls switch to this model while (running + queued) calls exceed
+    # MODEL_FALLBACK_LOAD x GEMINI_MAX_CONCURRENCY; empty disables the fallback
+    GEMINI_FALLBACK_MODEL = os.getenv('GEMINI_FALLBACK_MODEL', GEMINI_LIGHT_MODEL)
+    MODEL_FALLBACK_LOAD = float(os.getenv('MODEL_FALLBACK_LOAD', '1.0'))
+    
     # Cleanup Configuration
     CLEANUP_DAYS = int(os.getenv('CLEANUP_DAYS', '30'))
+    MAINTENANCE_INTERVAL_HOURS = float(os.getenv('MAINTENANCE_INTERVAL_HOURS', '6'))
+    MAINTENANCE_BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', '500'))
+    MAINTENANCE_TIME_BUDGET = float(os.getenv('MAINTENANCE_TIME_BUDGET', '10'))
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '')
+    
+    # Metrics Configuration (0 disables the Prometheus endpoint)
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
     
     @classmethod
     def validate(cls):
@@ -63,4 +155,16 @@ class Config:
             "top_p": cls.TOP_P,
             "top_k": cls.TOP_K,
             "max_output_tokens": cls.MAX_OUTPUT_TOKENS,
+        }
+    
+    @classmethod
+    def get_stage_config(cls, stage):
+        """Get the model name and generation configuration for a pipeline stage"""
+        prefix = stage.upper()
+        config = cls.get_gemini_config()
+        config["temperature"] = getattr(cls, f"{prefix}_TEMPERATURE", cls.TEMPERATURE)
+        config["max_output_tokens"] = getattr(cls, f"{prefix}_MAX_TOKENS", cls.MAX_OUTPUT_TOKENS)
+        return {
+            "model": getattr(cls, f"{prefix}_MODEL", cls.GEMINI_MODEL),
+            "generation_config": config,
         }
\ No newline at end of file
@@ -0,0 +1,109 @@
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+Key = Tuple[str, str]
+
+class ContextCache:
+    """Write-through ring buffers of recent exchanges per (user, channel).
+
+    Each buffer holds the newest `per_key` rows for its conversation. Buffers
+    are only created from a full database read, so a buffer is always an
+    exact suffix of the conversation's history. A global entry cap evicts
+    the least recently used conversations.
+    """
+
+    def __init__(self, per_key: int = 10, max_entries: int = 20000):
+        self.per_key = per_key
+        self.max_entries = max_entries
+        # key -> (rows, complete); complete means the DB had no older rows
+        self._buffers: "OrderedDict[Key, Tuple[Deque[Dict], bool]]" = OrderedDict()
+        self._size = 0
+        self.write_seq = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str, channel_id: str, since_ts: int, limit: int) -> Optional[List[Dict]]:
+        """Return up to `limit` rows newer than since_ts, or None if the DB must be asked"""
+        key = (user_id, channel_id)
+        entry = self._buffers.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        rows, complete = entry
+        recent = [row for row in rows if row['ts'] > since_ts]
+        # A full buffer with nothing filtered out may have older rows in the DB
+        if len(recent) < limit and len(recent) == len(rows) and not complete:
+            self.misses += 1
+            return None
+
+        self._buffers.move_to_end(key)
+        self.hits += 1
+        return recent[-limit:] if limit > 0 else []
+
+    def warm(self, user_id: str, channel_id: str, rows: List[Dict], seq: int):
+        """Populate a buffer from the newest rows read from the DB (oldest first).
+
+        `seq` is the write_seq observed before the read; if anything was
+        written since, the read may be stale and is not cached.
+        """
+        if seq != self.write_seq or self.per_key <= 0:
+            return
+        key = (user_id, channel_id)
+        self._drop(key)
+        buffer = deque(rows[-self.per_key:], maxlen=self.per_key)
+        self._buffers[key] = (buffer, len(rows) < self.per_key)
+        self._size += len(buffer)
+        self._evict()
+
+    def append(self, user_id: str, channel_id: str, row: Dict):
+        """Record a new exchange for a conversation that is already cached"""
+        self.write_seq += 1
+        key = (user_id, channel_id)
+        entry = self._buffers.get(key)
+        if entry is None:
+            return
+
+        rows, complete = entry
+        if len(rows) == rows.maxlen:
+            self._size -= 1
+            complete = False
+        rows.append(row)
+        self._size += 1
+        self._buffers[key] = (rows, complete)
+        self._buffers.move_to_end(key)
+        self._evict()
+
+    def invalidate(self, user_id: Optional[str] = None, channel_id: Optional[str] = None):
+        """Forget cached conversations (all of them when no key is given)"""
+        self.write_seq += 1
+        if user_id is None and channel_id is None:
+            self._buffers.clear()
+            self._size = 0
+            return
+        for key in [k for k in self._buffers
+                    if (user_id is None or k[0] == user_id)
+                    and (channel_id is None or k[1] == channel_id)]:
+            self._drop(key)
+
+    def _drop(self, key: Key):
+        entry = self._buffers.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+    def _evict(self):
+        while self._size > self.max_entries and self._buffers:
+            _, (rows, _) = self._buffers.popitem(last=False)
+            self._size -= len(rows)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict:
+        """Return hit/miss/eviction counters"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'conversations': len(self._buffers),
+            'entries': self._size,
+        }
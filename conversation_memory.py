@@ -1,97 +1,224 @@
+import asyncio
+import functools
 import sqlite3
 import json
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+import time
+from datetime import datetime
+from typing import AsyncIterator, Callable, List, Dict, Optional, Tuple
+
+from context_cache import ContextCache
+from metrics import DB_SECONDS, ERRORS, timed
+from migrations import migrate
+from storage import StorageEngine
+from vector_index import VectorIndex, conversation_text
+
+def _in_thread(fn, *args):
+    """Run fn(*args) on the default executor (asyncio.to_thread needs Python 3.9)"""
+    return asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
+
+def _format_ts(ts: int) -> str:
+    """Render an epoch timestamp as local ISO time for display"""
+    return datetime.fromtimestamp(ts).isoformat(sep=' ', timespec='seconds')
 
 class ConversationMemory:
-    def __init__(self, db_path: str = "conversation_memory.db"):
+    def __init__(self, db_path: str = "conversation_memory.db",
+                 storage: Optional[StorageEngine] = None,
+                 context_cache: Optional[ContextCache] = None,
+                 vector_index: Optional[VectorIndex] = None):
         self.db_path = db_path
+        self.storage = storage or StorageEngine(db_path)
+        self.context_cache = context_cache or ContextCache()
+        self.vector_index = vector_index
         self.init_database()
     
     def init_database(self):
-        """Initialize the SQLite database for conversation memory"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                channel_id TEXT NOT NULL,
-                message TEXT NOT NULL,
-                response TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                search_query TEXT
-            )
-        ''')
+        """Initialize the SQLite database and apply pending schema migrations"""
+        self.storage.submit_write(migrate, transactional=False).result()
         
-        conn.commit()
-        conn.close()
+        # None when SQLite lacks FTS5, otherwise the tokenizer the index was built with
+        row = self.storage.submit_read(lambda conn: conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'conversations_fts'"
+        ).fetchone()).result()
+        self.fts_tokenizer = None
+        if row:
+            self.fts_tokenizer = 'trigram' if 'trigram' in row[0] else 'unicode61'
+        
+        # Rows the vector index is missing (first run, or added since its last flush);
+        # anything inserted after this point is indexed as it is added
+        self._index_backlog = None
+        if self.vector_index:
+            newest = self.storage.submit_read(lambda conn: conn.execute(
+                "SELECT MAX(id) FROM conversations"
+            ).fetchone()[0]).result() or 0
+            self._index_backlog = (self.vector_index.last_id(), newest)
     
-    def add_conversation(self, user_id: str, channel_id: str, message: str, 
-                        response: str = None, search_query: str = None):
+    @timed(DB_SECONDS, op='add_conversation')
+    async def add_conversation(self, user_id: str, channel_id: str, message: str, 
+                              response: str = None, search_query: str = None):
         """Add a conversation entry to memory"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # Concurrent inserts are group-committed by the storage engine
+        ts = int(time.time())
+        conversation_id = await self.storage.execute('''
+            INSERT INTO conversations (user_id, channel_id, message, response, search_query, ts)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, channel_id, message, response, search_query, ts))
         
-        cursor.execute('''
-            INSERT INTO conversations (user_id, channel_id, message, response, search_query)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, channel_id, message, response, search_query))
+        self.context_cache.append(user_id, channel_id, {
+            'id': conversation_id,
+            'message': message,
+            'response': response,
+            'search_query': search_query,
+            'ts': ts
+        })
         
-        conn.commit()
-        conn.close()
+        if self.vector_index:
+            try:
+                await _in_thread(self.vector_index.add, conversation_id, user_id, channel_id,
+                                 conversation_text(message, response, search_query))
+            except Exception as e:
+                # The index is optional extra context; the row is stored and gets
+                # re-indexed from the database on the next start
+                ERRORS.inc(component='vector_index')
+                print(f"Error indexing conversation {conversation_id}: {e}")
+                try:
+                    await _in_thread(self.vector_index.mark_missing, conversation_id)
+                except Exception as mark_error:
+                    print(f"Error recording unindexed conversation {conversation_id}: {mark_error}")
     
-    def get_recent_context(self, user_id: str, channel_id: str, 
-                          hours: int = 24, limit: int = 10) -> List[Dict]:
+    @timed(DB_SECONDS, op='get_recent_context')
+    async def get_recent_context(self, user_id: str, channel_id: str, 
+                                hours: int = 24, limit: int = 10) -> List[Dict]:
         """Get recent conversation context for a user in a channel"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         # Get conversations from the last N hours
-        since_time = datetime.now() - timedelta(hours=hours)
+        since_ts = int(time.time()) - hours * 3600
         
-        cursor.execute('''
-            SELECT message, response, search_query, timestamp
-            FROM conversations
-            WHERE user_id = ? AND channel_id = ? AND timestamp > ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (user_id, channel_id, since_time.isoformat(), limit))
+        rows = self.context_cache.get(user_id, channel_id, since_ts, limit)
+        if rows is None:
+            # Miss: read the newest rows regardless of age so the buffer can be warmed
+            seq = self.context_cache.write_seq
+            results = await self.storage.fetchall('''
+                SELECT id, message, response, search_query, ts
+                FROM conversations
+                WHERE channel_id = ? AND user_id = ?
+                ORDER BY ts DESC, id DESC
+                LIMIT ?
+            ''', (channel_id, user_id, max(limit, self.context_cache.per_key)))
+            
+            rows = [{
+                'id': row[0],
+                'message': row[1],
+                'response': row[2],
+                'search_query': row[3],
+                'ts': row[4]
+            } for row in reversed(results)]
+            self.context_cache.warm(user_id, channel_id, rows, seq)
+            
+            rows = [row for row in rows if row['ts'] > since_ts]
+            rows = rows[-limit:] if limit > 0 else []
         
-        results = cursor.fetchall()
-        conn.close()
+        # Rows are chronological; hand out copies so callers can't mutate the cache
+        context = []
+        for row in rows:
+            context.append({
+                'id': row['id'],
+                'message': row['message'],
+                'response': row['response'],
+                'search_query': row['search_query'],
+                'timestamp': _format_ts(row['ts'])
+            })
         
-        # Convert to list of dictionaries, reverse to get chronological order
+        return context
+    
+    @timed(DB_SECONDS, op='get_relevant_context')
+    async def get_relevant_context(self, user_id: str, channel_id: str, query: str,
+                                   limit: int = 3, min_score: float = 0.2) -> List[Dict]:
+        """Get the past exchanges in a conversation most similar to query, best first"""
+        if not self.vector_index or limit <= 0:
+            return []
+        
+        matches = await _in_thread(
+            self.vector_index.search, query, channel_id, user_id, limit, min_score
+        )
+        if not matches:
+            return []
+        
+        ids = [conversation_id for conversation_id, _ in matches]
+        results = await self.storage.fetchall(f'''
+            SELECT id, message, response, search_query, ts
+            FROM conversations
+            WHERE id IN ({', '.join('?' * len(ids))})
+        ''', ids)
+        rows = {row[0]: row for row in results}
+        
+        # Rows removed by retention since they were indexed are skipped
         context = []
-        for row in reversed(results):
+        for conversation_id, score in matches:
+            row = rows.get(conversation_id)
+            if row is None:
+                continue
             context.append({
-                'message': row[0],
-                'response': row[1],
-                'search_query': row[2],
-                'timestamp': row[3]
+                'message': row[1],
+                'response': row[2],
+                'search_query': row[3],
+                'timestamp': _format_ts(row[4]),
+                'score': score
             })
         
         return context
     
-    def get_channel_context(self, channel_id: str, hours: int = 2, 
-                           limit: int = 20) -> List[Dict]:
-        """Get recent channel conversation context"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    async def index_backlog(self, batch_size: int = 500) -> int:
+        """Add conversations missing from the vector index; return how many were indexed"""
+        if not self._index_backlog:
+            return 0
+        after, newest = self._index_backlog
+        await self.prune_index()
+        # Rows after a failed add may already be indexed
+        done = await _in_thread(self.vector_index.indexed_after, after)
+        
+        indexed = 0
+        while after < newest:
+            rows = await self.storage.fetchall('''
+                SELECT id, user_id, channel_id, message, response, search_query
+                FROM conversations
+                WHERE id > ? AND id <= ?
+                ORDER BY id
+                LIMIT ?
+            ''', (after, newest, batch_size))
+            if not rows:
+                break
+            missing = [row for row in rows if row[0] not in done]
+            await _in_thread(self.vector_index.add_many, [
+                (row[0], row[1], row[2], conversation_text(row[3], row[4], row[5])) for row in missing
+            ])
+            indexed += len(missing)
+            after = rows[-1][0]
         
-        since_time = datetime.now() - timedelta(hours=hours)
+        await _in_thread(self.vector_index.clear_missing, newest)
+        self._index_backlog = None
+        return indexed
+    
+    async def prune_index(self) -> int:
+        """Drop vector index rows for conversations that retention has deleted"""
+        if not self.vector_index:
+            return 0
+        row = await self.storage.fetchone("SELECT MIN(id) FROM conversations")
+        if row[0] is None:
+            return 0
+        return await _in_thread(self.vector_index.prune, row[0])
+    
+    @timed(DB_SECONDS, op='get_channel_context')
+    async def get_channel_context(self, channel_id: str, hours: int = 2, 
+                                 limit: int = 20) -> List[Dict]:
+        """Get recent channel conversation context"""
+        since_ts = int(time.time()) - hours * 3600
         
-        cursor.execute('''
-            SELECT user_id, message, response, search_query, timestamp
+        results = await self.storage.fetchall('''
+            SELECT user_id, message, response, search_query, ts
             FROM conversations
-            WHERE channel_id = ? AND timestamp > ?
-            ORDER BY timestamp DESC
+            WHERE channel_id = ? AND ts > ?
+            ORDER BY ts DESC, id DESC
             LIMIT ?
-        ''', (channel_id, since_time.isoformat(), limit))
-        
-        results = cursor.fetchall()
-        conn.close()
+        ''', (channel_id, since_ts, limit))
         
         context = []
         for row in reversed(results):
@@ -100,26 +227,21 @@ class ConversationMemory:
                 'message': row[1],
                 'response': row[2],
                 'search_query': row[3],
-                'timestamp': row[4]
+                'timestamp': _format_ts(row[4])
             })
         
         return context
     
-    def get_logs_by_date_range(self, channel_id: str, start_date: datetime, 
-                              end_date: datetime) -> List[Dict]:
+    @timed(DB_SECONDS, op='get_logs_by_date_range')
+    async def get_logs_by_date_range(self, channel_id: str, start_date: datetime, 
+                                    end_date: datetime) -> List[Dict]:
         """Get conversation logs for a specific date range"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT user_id, message, response, search_query, timestamp
+        results = await self.storage.fetchall('''
+            SELECT user_id, message, response, search_query, ts
             FROM conversations
-            WHERE channel_id = ? AND timestamp BETWEEN ? AND ?
-            ORDER BY timestamp ASC
-        ''', (channel_id, start_date.isoformat(), end_date.isoformat()))
-        
-        results = cursor.fetchall()
-        conn.close()
+            WHERE channel_id = ? AND ts BETWEEN ? AND ?
+            ORDER BY ts ASC, id ASC
+        ''', (channel_id, int(start_date.timestamp()), int(end_date.timestamp())))
         
         logs = []
         for row in results:
@@ -128,22 +250,166 @@ class ConversationMemory:
                 'message': row[1],
                 'response': row[2],
                 'search_query': row[3],
-                'timestamp': row[4]
+                'timestamp': _format_ts(row[4])
+            })
+        
+        return logs
+    
+    @timed(DB_SECONDS, op='get_logs_page')
+    async def get_logs_page(self, channel_id: str, start_date: datetime, end_date: datetime,
+                            after: Optional[Tuple[int, int]] = None,
+                            limit: int = 20) -> List[Dict]:
+        """Get one page of logs in a date range, resuming after a (ts, id) cursor"""
+        start_ts, end_ts = int(start_date.timestamp()), int(end_date.timestamp())
+        # Keyset pagination: seek past the cursor instead of OFFSET scanning
+        cursor_ts, cursor_id = after if after else (start_ts - 1, 0)
+        
+        results = await self.storage.fetchall('''
+            SELECT id, user_id, message, response, search_query, ts
+            FROM conversations
+            WHERE channel_id = ? AND ts BETWEEN ? AND ? AND (ts, id) > (?, ?)
+            ORDER BY ts ASC, id ASC
+            LIMIT ?
+        ''', (channel_id, start_ts, end_ts, cursor_ts, cursor_id, limit))
+        
+        logs = []
+        for row in results:
+            logs.append({
+                'id': row[0],
+                'user_id': row[1],
+                'message': row[2],
+                'response': row[3],
+                'search_query': row[4],
+                'ts': row[5],
+                'timestamp': _format_ts(row[5])
             })
         
         return logs
     
-    def cleanup_old_conversations(self, days_to_keep: int = 30):
-        """Clean up old conversation data"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    async def iter_logs(self, channel_id: str, start_date: datetime, end_date: datetime,
+                        page_size: int = 500) -> AsyncIterator[Dict]:
+        """Stream logs in a date range page by page without loading them all"""
+        after = None
+        while True:
+            page = await self.get_logs_page(channel_id, start_date, end_date, after, page_size)
+            for log in page:
+                yield log
+            if len(page) < page_size:
+                break
+            after = (page[-1]['ts'], page[-1]['id'])
+    
+    @timed(DB_SECONDS, op='count_logs')
+    async def count_logs(self, channel_id: str, start_date: datetime, end_date: datetime) -> int:
+        """Count conversations in a date range"""
+        row = await self.storage.fetchone('''
+            SELECT COUNT(*) FROM conversations
+            WHERE channel_id = ? AND ts BETWEEN ? AND ?
+        ''', (channel_id, int(start_date.timestamp()), int(end_date.timestamp())))
+        return row[0]
+    
+    @timed(DB_SECONDS, op='search_history')
+    async def search_history(self, channel_id: str, terms: str, limit: int = 5,
+                             offset: int = 0) -> Tuple[List[Dict], int]:
+        """Full-text search a channel's past conversations, best matches first.
+        
+        Returns one page of results and the total number of matches.
+        """
+        if not self.fts_tokenizer:
+            raise RuntimeError("Full-text search is not available in this SQLite build")
+        
+        words = terms.split()
+        # The trigram tokenizer can't match terms shorter than three characters;
+        # those are applied as substring filters on the matching rows instead
+        min_len = 3 if self.fts_tokenizer == 'trigram' else 1
+        match = ' '.join('"' + w.replace('"', '""') + '"' for w in words if len(w) >= min_len)
+        short = [w.casefold() for w in words if len(w) < min_len]
+        
+        filters = ''.join(
+            " AND instr(lower(c.message || ' ' || ifnull(c.response, '')), ?) > 0" for _ in short
+        )
+        if match:
+            source = '''
+                FROM conversations_fts
+                JOIN conversations c ON c.id = conversations_fts.rowid
+                WHERE conversations_fts MATCH ? AND c.channel_id = ?''' + filters
+            params = [match, channel_id] + short
+            snippet = "snippet(conversations_fts, -1, '**', '**', '...', 16)"
+            order = "rank"
+        else:
+            source = '''
+                FROM conversations c
+                WHERE c.channel_id = ?''' + filters
+            params = [channel_id] + short
+            snippet = "NULL"
+            order = "c.ts DESC"
+        
+        total = (await self.storage.fetchone("SELECT COUNT(*)" + source, params))[0]
+        results = await self.storage.fetchall(f'''
+            SELECT c.id, c.user_id, c.message, c.response, c.search_query, c.ts, {snippet}
+            {source}
+            ORDER BY {order}
+            LIMIT ? OFFSET ?
+        ''', params + [limit, offset])
+        
+        matches = []
+        for row in results:
+            matches.append({
+                'id': row[0],
+                'user_id': row[1],
+                'message': row[2],
+                'response': row[3],
+                'search_query': row[4],
+                'ts': row[5],
+                'timestamp': _format_ts(row[5]),
+                'snippet': row[6]
+            })
+        
+        return matches, total
+    
+    @timed(DB_SECONDS, op='cleanup_old_conversations')
+    async def cleanup_old_conversations(self, days_to_keep: int = 30, batch_size: int = 500,
+                                        time_budget: Optional[float] = None,
+                                        archiver: Optional[Callable[[List[tuple]], None]] = None) -> int:
+        """Clean up old conversation data in small batches and return the rows removed.
         
-        cutoff_date = datetime.now() - timedelta(days=days_to_keep)
+        Each batch is read on a reader connection, handed to the archiver (if
+        any) on a worker thread, then deleted by id in its own short write,
+        so live traffic can interleave and slow archive I/O never holds the
+        write lock. Stops early once time_budget seconds have passed.
+        """
+        cutoff_ts = int(time.time()) - days_to_keep * 86400
+        started = time.monotonic()
+        deleted = 0
         
-        cursor.execute('''
-            DELETE FROM conversations
-            WHERE timestamp < ?
-        ''', (cutoff_date.isoformat(),))
+        def read_batch(conn: sqlite3.Connection) -> List[tuple]:
+            return conn.execute('''
+                SELECT id, user_id, channel_id, message, response, search_query, ts
+                FROM conversations
+                WHERE ts < ?
+                ORDER BY ts ASC
+                LIMIT ?
+            ''', (cutoff_ts, batch_size)).fetchall()
         
-        conn.commit()
-        conn.close()
\ No newline at end of file
+        while True:
+            rows = await self.storage.run_read(read_batch)
+            if not rows:
+                break
+            if archiver:
+                await _in_thread(archiver, rows)
+            deleted += await self.storage.executemany(
+                "DELETE FROM conversations WHERE id = ?", [(row[0],) for row in rows]
+            )
+            if len(rows) < batch_size:
+                break
+            if time_budget is not None and time.monotonic() - started >= time_budget:
+                break
+        
+        if deleted:
+            self.context_cache.invalidate()
+        return deleted
+    
+    def close(self):
+        """Flush pending writes and close the storage engine"""
+        if self.vector_index:
+            self.vector_index.flush()
+        self.storage.close()
\ No newline at end of file
@@ -0,0 +1,66 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import discord
+
+Key = Tuple[int, int]
+
+class MessageDebouncer:
+    """Gather bursts of messages per (channel, author) and hand each burst off once.
+
+    A burst ends when `window` seconds pass without a new message from the
+    same author in the same channel, or when it reaches `max_batch` messages.
+    """
+
+    def __init__(self, callback: Callable[[List[discord.Message]], Awaitable[None]],
+                 window: float = 2.0, max_batch: int = 5):
+        self.callback = callback
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._pending: Dict[Key, List[discord.Message]] = {}
+        self._timers: Dict[Key, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.messages = 0
+        self.batches = 0
+
+    def add(self, message: discord.Message):
+        """Queue a message; its burst is flushed once the window goes quiet"""
+        key = (message.channel.id, message.author.id)
+        batch = self._pending.setdefault(key, [])
+        batch.append(message)
+        self.messages += 1
+
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+
+        if len(batch) >= self.max_batch or self.window <= 0:
+            self._flush(key)
+        else:
+            loop = asyncio.get_running_loop()
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+
+    def _flush(self, key: Key):
+        self._timers.pop(key, None)
+        batch = self._pending.pop(key, None)
+        if not batch:
+            return
+        self.batches += 1
+        task = asyncio.ensure_future(self.callback(batch))
+        # Keep a reference so the task isn't garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def flush_all(self):
+        """Hand off every pending burst immediately (e.g. on shutdown)"""
+        for key in list(self._pending):
+            timer = self._timers.pop(key, None)
+            if timer:
+                timer.cancel()
+            self._flush(key)
+
+    async def drain(self, timeout: Optional[float] = None):
+        """Flush every pending burst and wait for the handed-off callbacks to finish"""
+        self.flush_all()
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
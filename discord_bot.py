@@ -4,17 +4,38 @@ import asyncio
 import os
 from datetime import datetime, timedelta
 import re
-from typing import Optional
+from typing import List, Optional
 from dotenv import load_dotenv
 
+from chunker import pack_embeds
+from config import Config
+from context_cache import ContextCache
 from conversation_memory import ConversationMemory
+from debounce import MessageDebouncer
+from discord_views import HistoryPaginator, LogPaginator, export_logs
+from maintenance import MaintenanceTask
+from outbound import OutboundDispatcher
 from gemini_search import GeminiSearchBot
+from monitored_channels import MonitoredChannels
+from metrics import (DB_SECONDS, ERRORS, MODEL_CALLS, MODEL_FALLBACKS, MODEL_TOKENS, REGISTRY,
+                     SEND_SECONDS, STAGE_SECONDS, MetricsServer)
+from scheduler import (JobScheduler, JobShedError, QueueFullError,
+                       PRIORITY_AUTO, PRIORITY_MANUAL)
+from storage import create_storage
+from streaming_reply import StreamingReply
+from summarizer import ConversationSummarizer
+import vector_index
 
 # Load environment variables
 load_dotenv()
 
-class GeminiDiscordBot(commands.Bot):
-    def __init__(self):
+def fairness_key(message):
+    """Group queued work by guild (or channel for DMs) for round-robin scheduling"""
+    return message.guild.id if message.guild else message.channel.id
+
+class GeminiDiscordBot(commands.AutoShardedBot):
+    def __init__(self, shard_ids: Optional[List[int]] = None, shard_count: Optional[int] = None,
+                 process_index: int = 0):
         # Bot setup with intents
         intents = discord.Intents.default()
         intents.message_content = True
@@ -24,18 +45,152 @@ class GeminiDiscordBot(commands.Bot):
         super().__init__(
             command_prefix='!',
             intents=intents,
-            help_command=None
+            help_command=None,
+            shard_ids=shard_ids,
+            shard_count=shard_count
+        )
+        self.process_index = process_index
+        
+        # Similarity index of past exchanges; memory-mapped files can't be shared, so one per process
+        index = None
+        if Config.VECTOR_INDEX_ENABLED:
+            if vector_index.available():
+                index = vector_index.VectorIndex(
+                    os.path.join(Config.VECTOR_INDEX_DIR, f"process-{process_index}"),
+                    dim=Config.VECTOR_DIM
+                )
+            else:
+                print("Relevant context retrieval disabled: numpy is not installed")
+        
+        # Initialize components; every shard process shares one database
+        self.memory = ConversationMemory(
+            Config.DATABASE_PATH,
+            storage=create_storage(Config.DATABASE_URL or Config.DATABASE_PATH),
+            context_cache=ContextCache(
+                per_key=Config.CONTEXT_CACHE_PER_KEY,
+                max_entries=Config.CONTEXT_CACHE_MAX_ENTRIES
+            ),
+            vector_index=index
         )
+        self._index_task: Optional[asyncio.Task] = None
+        self.gemini = GeminiSearchBot(os.getenv('GEMINI_API_KEY'), storage=self.memory.storage)
+        self.monitored_channels = MonitoredChannels(self.memory.storage, Config.MONITOR_REFRESH_SECONDS)
         
-        # Initialize components
-        self.memory = ConversationMemory()
-        self.gemini = GeminiSearchBot(os.getenv('GEMINI_API_KEY'))
-        self.monitored_channels = set()
+        # Worker pool between Discord events and Gemini processing
+        self.scheduler = JobScheduler(
+            workers=Config.WORKER_COUNT,
+            max_queue=Config.MAX_QUEUE_SIZE,
+            stale_after=Config.AUTO_SEARCH_STALE_SECONDS
+        )
+        
+        # Rolling per-conversation summaries, updated after each exchange
+        self.summarizer = None
+        if Config.SUMMARIES_ENABLED:
+            self.summarizer = ConversationSummarizer(
+                self.memory.storage,
+                self.gemini.client,
+                summary_tokens=Config.SUMMARY_TOKEN_BUDGET,
+                batch_size=Config.SUMMARY_BATCH_SIZE
+            )
+        
+        # Retention and database upkeep off the request path
+        self.maintenance = MaintenanceTask(
+            self.memory,
+            retention_days=Config.CLEANUP_DAYS,
+            interval_hours=Config.MAINTENANCE_INTERVAL_HOURS,
+            batch_size=Config.MAINTENANCE_BATCH_SIZE,
+            time_budget=Config.MAINTENANCE_TIME_BUDGET,
+            archive_dir=Config.ARCHIVE_DIR or None,
+            search_cache=self.gemini.search_cache,
+            summarizer=self.summarizer
+        )
+        
+        # Replies are queued per channel and paced under Discord's rate limits
+        self.outbound = OutboundDispatcher(
+            rate_per_minute=Config.OUTBOUND_RATE_PER_MINUTE,
+            burst=Config.OUTBOUND_BURST
+        )
+        
+        # Bursts of quick messages from one author become a single auto-search
+        self.debouncer = MessageDebouncer(
+            self.auto_search_batch,
+            window=Config.DEBOUNCE_SECONDS,
+            max_batch=Config.DEBOUNCE_MAX_BATCH
+        )
         
         # Load monitored channels from environment or default
         channel_id = os.getenv('CHANNEL_ID')
         if channel_id:
-            self.monitored_channels.add(int(channel_id))
+            self.monitored_channels.seed(int(channel_id))
+        
+        # Local Prometheus endpoint; the same numbers back !stats
+        # Each shard process listens on its own port, counting up from METRICS_PORT
+        self.metrics_server = None
+        if Config.METRICS_PORT > 0:
+            self.metrics_server = MetricsServer(host=Config.METRICS_HOST,
+                                                port=Config.METRICS_PORT + process_index)
+        self._register_metrics()
+    
+    def _register_metrics(self):
+        """Expose counters the components already keep alongside the timing histograms"""
+        def cache_samples():
+            samples = []
+            caches = [('context', self.memory.context_cache)]
+            if self.gemini.search_cache:
+                caches.append(('search', self.gemini.search_cache))
+            for name, cache in caches:
+                stats = cache.get_stats()
+                samples.append(({'cache': name, 'result': 'hit'}, stats['hits']))
+                samples.append(({'cache': name, 'result': 'miss'}, stats['misses']))
+            return samples
+        
+        def queue_samples():
+            stats = self.scheduler.get_stats()
+            return [({'priority': 'manual'}, stats['depth_manual']), ({'priority': 'auto'}, stats['depth_auto'])]
+        
+        def job_samples():
+            stats = self.scheduler.get_stats()
+            return [({'outcome': key}, stats[key]) for key in ('completed', 'failed', 'shed', 'rejected')]
+        
+        REGISTRY.callback('gemini_bot_cache_lookups_total', 'Cache lookups by cache and result',
+                          'counter', cache_samples)
+        REGISTRY.callback('gemini_bot_singleflight_coalesced_total', 'Searches that joined an identical call in flight',
+                          'counter', lambda: [({}, self.gemini.search_flight.coalesced)])
+        REGISTRY.callback('gemini_bot_queue_depth', 'Jobs waiting in the scheduler queue',
+                          'gauge', queue_samples)
+        REGISTRY.callback('gemini_bot_jobs_total', 'Scheduler jobs by outcome',
+                          'counter', job_samples)
+        REGISTRY.callback('gemini_bot_outbound_queue_depth', 'Discord sends waiting in per-channel queues',
+                          'gauge', lambda: [({}, self.outbound.get_stats()['queued'])])
+        REGISTRY.callback('gemini_bot_model_in_flight', 'Gemini calls currently running',
+                          'gauge', lambda: [({}, self.gemini.client.in_flight)])
+        REGISTRY.callback('gemini_bot_breaker_open', 'Whether the Gemini circuit breaker is refusing calls',
+                          'gauge', lambda: [({}, int(self.gemini.client.resilience.breaker.state != 'closed'))])
+        if self.summarizer:
+            REGISTRY.callback('gemini_bot_summary_updates_total', 'Conversation summary updates by outcome',
+                              'counter', lambda: [({'outcome': 'updated'}, self.summarizer.updates),
+                                                  ({'outcome': 'skipped'}, self.summarizer.skipped)])
+        if self.memory.vector_index:
+            REGISTRY.callback('gemini_bot_vector_index_rows', 'Past exchanges in the relevance index',
+                              'gauge', lambda: [({}, self.memory.vector_index.count)])
+        if self.gemini.rate_limiter:
+            REGISTRY.callback('gemini_bot_rate_limit_waits_total', 'Gemini calls that waited for the rate limiter',
+                              'counter', lambda: [({}, self.gemini.rate_limiter.waits)])
+    
+    async def setup_hook(self):
+        self.scheduler.start()
+        self.monitored_channels.start()
+        if self.memory.vector_index:
+            self._index_task = asyncio.create_task(self._index_backlog())
+        # Retention runs against the shared database, so only the first process does it
+        if self.process_index == 0:
+            self.maintenance.start()
+        if self.metrics_server:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                print(f"Metrics endpoint disabled: {e}")
+                self.metrics_server = None
     
     async def on_ready(self):
         print(f'{self.user} has connected to Discord!')
@@ -49,6 +204,33 @@ class GeminiDiscordBot(commands.Bot):
             )
         )
     
+    async def _index_backlog(self):
+        """Index conversations stored while this process's vector index was behind"""
+        try:
+            indexed = await self.memory.index_backlog()
+            if indexed:
+                print(f"Vector index: added {indexed} earlier conversations")
+        except Exception as e:
+            print(f"Error indexing earlier conversations: {e}")
+    
+    async def close(self):
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        if self._index_task:
+            self._index_task.cancel()
+            await asyncio.gather(self._index_task, return_exceptions=True)
+        await self.maintenance.stop()
+        await self.monitored_channels.stop()
+        # Answer bursts still inside the debounce window while the workers are running
+        await self.debouncer.drain(timeout=Config.AUTO_SEARCH_BUDGET or None)
+        if self.summarizer:
+            await self.summarizer.stop()
+        await self.scheduler.stop()
+        await self.outbound.close()
+        await super().close()
+        # Flush queued writes once the gateway is down
+        self.memory.close()
+    
     async def on_message(self, message):
         # Ignore bot's own messages
         if message.author == self.user:
@@ -59,49 +241,98 @@ class GeminiDiscordBot(commands.Bot):
         
         # Auto-search in monitored channels (if not a command)
         if (message.channel.id in self.monitored_channels and 
-            not message.content.startswith('!') and
-            len(message.content) > 10):  # Only for substantial messages
+            not message.content.startswith('!')):
             
-            await self.auto_search(message)
+            self.debouncer.add(message)
+    
+    async def get_summary(self, user_id: str, channel_id: str) -> Optional[dict]:
+        """Rolling summary of a conversation, if summaries are enabled and one exists"""
+        if not self.summarizer:
+            return None
+        # Same window as the raw context, so a stale summary doesn't outlive the history it replaces
+        return await self.summarizer.get(user_id, channel_id, max_age=Config.CONTEXT_HOURS * 3600)
+    
+    async def get_relevant(self, user_id: str, channel_id: str, query: str) -> List[dict]:
+        """Earlier exchanges in a conversation most similar to query"""
+        try:
+            return await self.memory.get_relevant_context(
+                user_id, channel_id, query,
+                limit=Config.RELEVANT_CONTEXT_K,
+                min_score=Config.RELEVANT_MIN_SCORE
+            )
+        except Exception as e:
+            # Extra context only; the answer goes ahead without it
+            ERRORS.inc(component='relevant_context')
+            print(f"Error retrieving relevant context: {e}")
+            return []
+    
+    async def auto_search_batch(self, messages):
+        """Auto-search a debounced burst of messages as one question"""
+        content = '\n'.join(m.content for m in messages if m.content.strip())
+        
+        # Only for substantial messages
+        if len(content) > Config.AUTO_SEARCH_MIN_LENGTH:
+            await self.auto_search(messages[-1], content)
     
-    async def auto_search(self, message):
+    async def auto_search(self, message, content: Optional[str] = None):
         """Automatically search and respond to messages in monitored channels"""
+        content = content or message.content
         try:
             # Show typing indicator
             async with message.channel.typing():
                 # Get conversation context
-                context = self.memory.get_recent_context(
+                context = await self.memory.get_recent_context(
                     str(message.author.id),
                     str(message.channel.id),
-                    hours=24,
+                    hours=Config.CONTEXT_HOURS,
                     limit=5
                 )
+                summary = await self.get_summary(str(message.author.id), str(message.channel.id))
+                relevant = await self.get_relevant(str(message.author.id), str(message.channel.id), content)
                 
-                # Process the message with Gemini
-                result = await self.gemini.process_message(message.content, context)
+                # Process the message with Gemini on the shared worker pool
+                reply = None
+                on_chunk = None
+                if Config.STREAM_RESPONSES:
+                    # Post the answer as it is generated instead of after the whole completion
+                    reply = StreamingReply(message, self.outbound, edit_interval=Config.STREAM_EDIT_INTERVAL)
+                    on_chunk = reply.feed
+                
+                try:
+                    result = await self.scheduler.submit(
+                        fairness_key(message),
+                        lambda: self.gemini.process_message(
+                            content, context, on_chunk=on_chunk,
+                            budget=Config.AUTO_SEARCH_BUDGET, summary=summary, relevant=relevant
+                        ),
+                        priority=PRIORITY_AUTO
+                    )
+                except (QueueFullError, JobShedError) as e:
+                    # Auto-search is best effort; under overload it is dropped quietly
+                    print(f"Auto-search dropped: {e}")
+                    return
+                
+                # Queue the response (streamed answers only need their final edit)
+                if reply:
+                    await reply.finish(result['response'])
+                else:
+                    self.outbound.reply_chunked(message, result['response'])
                 
                 # Store in memory
-                self.memory.add_conversation(
+                await self.memory.add_conversation(
                     user_id=str(message.author.id),
                     channel_id=str(message.channel.id),
-                    message=message.content,
+                    message=content,
                     response=result['response'],
                     search_query='; '.join(result['search_queries'])
                 )
-                
-                # Send response
-                if len(result['response']) > 2000:
-                    # Split long messages
-                    chunks = [result['response'][i:i+1900] 
-                             for i in range(0, len(result['response']), 1900)]
-                    for chunk in chunks:
-                        await message.reply(chunk)
-                else:
-                    await message.reply(result['response'])
+                if self.summarizer:
+                    self.summarizer.schedule(str(message.author.id), str(message.channel.id))
                     
         except Exception as e:
+            ERRORS.inc(component='auto_search')
             print(f"Error in auto_search: {e}")
-            await message.reply("Sorry, I encountered an error while processing your message.")
+            self.outbound.reply(message, "Sorry, I encountered an error while processing your message.")
 
 # Bot Commands
 @commands.command(name='search')
@@ -110,54 +341,76 @@ async def manual_search(ctx, *, query):
     try:
         async with ctx.typing():
             # Get conversation context
-            context = ctx.bot.memory.get_recent_context(
+            context = await ctx.bot.memory.get_recent_context(
                 str(ctx.author.id),
                 str(ctx.channel.id),
-                hours=24,
+                hours=Config.CONTEXT_HOURS,
                 limit=5
             )
+            summary = await ctx.bot.get_summary(str(ctx.author.id), str(ctx.channel.id))
+            relevant = await ctx.bot.get_relevant(str(ctx.author.id), str(ctx.channel.id), query)
             
-            # Process the query
-            result = await ctx.bot.gemini.process_message(query, context)
+            # Process the query ahead of queued auto-searches
+            try:
+                result = await ctx.bot.scheduler.submit(
+                    fairness_key(ctx.message),
+                    lambda: ctx.bot.gemini.process_message(
+                        query, context, budget=Config.MANUAL_SEARCH_BUDGET, summary=summary,
+                        relevant=relevant
+                    ),
+                    priority=PRIORITY_MANUAL
+                )
+            except QueueFullError:
+                await ctx.reply("⏳ I'm handling a lot of requests right now. Please try again in a moment.")
+                return
             
             # Store in memory
-            ctx.bot.memory.add_conversation(
+            await ctx.bot.memory.add_conversation(
                 user_id=str(ctx.author.id),
                 channel_id=str(ctx.channel.id),
                 message=query,
                 response=result['response'],
                 search_query='; '.join(result['search_queries'])
             )
+            if ctx.bot.summarizer:
+                ctx.bot.summarizer.schedule(str(ctx.author.id), str(ctx.channel.id))
             
-            # Create embed for better formatting
-            embed = discord.Embed(
-                title="🔍 Search Results",
-                description=result['response'],
-                color=0x00ff00,
-                timestamp=datetime.now()
-            )
-            embed.add_field(
-                name="Search Queries Used",
-                value='\n'.join([f"• {q}" for q in result['search_queries']]),
-                inline=False
-            )
-            embed.set_footer(text=f"Requested by {ctx.author.display_name}")
+            # Create embeds for better formatting; long answers continue in more embeds
+            title = "🔍 Search Results"
+            queries = '\n'.join([f"• {q}" for q in result['search_queries']])[:1024]
+            footer = f"Requested by {ctx.author.display_name}"
+            reserved = len(title) + len("Search Queries Used") + len(queries) + len(footer)
             
-            await ctx.reply(embed=embed)
+            for page, descriptions in enumerate(pack_embeds(result['response'], reserved=reserved)):
+                embeds = [discord.Embed(description=d, color=0x00ff00) for d in descriptions]
+                if page == 0:
+                    embeds[0].title = title
+                    if queries:
+                        embeds[-1].add_field(name="Search Queries Used", value=queries, inline=False)
+                    embeds[-1].set_footer(text=footer)
+                    embeds[-1].timestamp = datetime.now()
+                
+                ctx.bot.outbound.reply(ctx.message, embeds=embeds)
             
     except Exception as e:
+        ERRORS.inc(component='manual_search')
         await ctx.reply(f"Error performing search: {str(e)}")
 
 @commands.command(name='logs')
-async def get_logs(ctx, date_filter: Optional[str] = None):
+async def get_logs(ctx, date_filter: Optional[str] = None, mode: Optional[str] = None):
     """
     Get conversation logs. Usage:
     !logs - Get today's logs
     !logs yesterday - Get yesterday's logs
     !logs 2024-01-15 - Get logs for specific date
     !logs 7days - Get logs for last 7 days
+    !logs 30days export - Download the logs as a gzip'd text file
     """
     try:
+        if date_filter and date_filter.lower() == 'export':
+            date_filter, mode = None, 'export'
+        mode = mode.lower() if mode else None
+        
         # Parse date filter
         if not date_filter or date_filter.lower() == 'today':
             start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -186,55 +439,74 @@ async def get_logs(ctx, date_filter: Optional[str] = None):
             await ctx.reply("Invalid date format. Use: today, yesterday, 7days, or YYYY-MM-DD")
             return
         
-        # Get logs from database
-        logs = ctx.bot.memory.get_logs_by_date_range(
-            str(ctx.channel.id),
-            start_date,
-            end_date
-        )
+        channel_id = str(ctx.channel.id)
         
-        if not logs:
-            await ctx.reply(f"No logs found for {title.lower()}")
+        if mode == 'export':
+            # Stream the whole range into a compressed attachment
+            output, count = await export_logs(ctx.bot.memory, channel_id, start_date, end_date)
+            if not count:
+                await ctx.reply(f"No logs found for {title.lower()}")
+                return
+            
+            size = output.seek(0, 2)
+            output.seek(0)
+            limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+            if size > limit:
+                await ctx.reply("❌ The export is too large to upload. Try a shorter date range.")
+                return
+            
+            filename = f"logs-{ctx.channel.id}-{start_date:%Y%m%d}-{end_date:%Y%m%d}.txt.gz"
+            await ctx.bot.outbound.reply(
+                ctx.message,
+                f"📋 **{title}** ({count} conversations)",
+                file=discord.File(output, filename=filename)
+            )
             return
         
-        # Format logs
-        log_text = []
-        for log in logs:
-            timestamp = datetime.fromisoformat(log['timestamp']).strftime('%H:%M:%S')
-            user_mention = f"<@{log['user_id']}>"
-            log_text.append(f"**{timestamp}** {user_mention}: {log['message'][:100]}{'...' if len(log['message']) > 100 else ''}")
-            if log['response']:
-                log_text.append(f"🤖: {log['response'][:100]}{'...' if len(log['response']) > 100 else ''}")
-            log_text.append("")  # Empty line for separation
+        # Count matches, then fetch only the page being shown
+        total = await ctx.bot.memory.count_logs(channel_id, start_date, end_date)
         
-        # Split into multiple messages if too long
-        full_text = '\n'.join(log_text)
+        if not total:
+            await ctx.reply(f"No logs found for {title.lower()}")
+            return
         
-        if len(full_text) <= 1900:
-            embed = discord.Embed(
-                title=f"📋 {title}",
-                description=full_text,
-                color=0x0099ff,
-                timestamp=datetime.now()
-            )
-            embed.set_footer(text=f"{len(logs)} conversations found")
-            await ctx.reply(embed=embed)
+        view = LogPaginator(
+            ctx.bot.memory, channel_id, start_date, end_date,
+            title=title, total=total, author_id=ctx.author.id
+        )
+        await view.load()
+        
+        if view.page_count == 1:
+            ctx.bot.outbound.reply(ctx.message, embeds=[view.embed()])
         else:
-            # Send as multiple messages
-            await ctx.reply(f"📋 **{title}** ({len(logs)} conversations)")
-            
-            chunks = [full_text[i:i+1900] for i in range(0, len(full_text), 1900)]
-            for i, chunk in enumerate(chunks):
-                embed = discord.Embed(
-                    description=chunk,
-                    color=0x0099ff
-                )
-                embed.set_footer(text=f"Part {i+1}/{len(chunks)}")
-                await ctx.send(embed=embed)
+            view.message = await ctx.bot.outbound.reply(ctx.message, embeds=[view.embed()], view=view)
                 
     except Exception as e:
         await ctx.reply(f"Error retrieving logs: {str(e)}")
 
+@commands.command(name='history')
+async def search_history(ctx, *, terms: str):
+    """Search this channel's past conversations. Usage: !history <terms>"""
+    try:
+        if not ctx.bot.memory.fts_tokenizer:
+            await ctx.reply("❌ History search isn't available on this server's database.")
+            return
+        
+        view = HistoryPaginator(
+            ctx.bot.memory, str(ctx.channel.id), terms, author_id=ctx.author.id
+        )
+        await view.load()
+        
+        if not view.total:
+            await ctx.reply(f"No past conversations found for \"{terms}\"")
+        elif view.page_count == 1:
+            ctx.bot.outbound.reply(ctx.message, embeds=[view.embed()])
+        else:
+            view.message = await ctx.bot.outbound.reply(ctx.message, embeds=[view.embed()], view=view)
+            
+    except Exception as e:
+        await ctx.reply(f"Error searching history: {str(e)}")
+
 @commands.command(name='monitor')
 @commands.has_permissions(manage_channels=True)
 async def toggle_monitoring(ctx, action: str = "status"):
@@ -247,17 +519,85 @@ async def toggle_monitoring(ctx, action: str = "status"):
     channel_id = ctx.channel.id
     
     if action.lower() == "on":
-        ctx.bot.monitored_channels.add(channel_id)
+        await ctx.bot.monitored_channels.enable(
+            channel_id,
+            guild_id=ctx.guild.id if ctx.guild else None,
+            user_id=ctx.author.id
+        )
         await ctx.reply("✅ Auto-search monitoring enabled for this channel!")
         
     elif action.lower() == "off":
-        ctx.bot.monitored_channels.discard(channel_id)
+        await ctx.bot.monitored_channels.disable(channel_id)
         await ctx.reply("❌ Auto-search monitoring disabled for this channel.")
         
     else:  # status
         status = "🟢 Enabled" if channel_id in ctx.bot.monitored_channels else "🔴 Disabled"
         await ctx.reply(f"Auto-search monitoring status: {status}")
 
+def _format_timing(histogram, **labels) -> str:
+    return (f"p50 {histogram.quantile(0.5, **labels):.2f}s • "
+            f"p95 {histogram.quantile(0.95, **labels):.2f}s • n={histogram.count(**labels)}")
+
+@commands.command(name='stats')
+async def show_stats(ctx):
+    """Show latency, model usage, cache and queue statistics"""
+    embed = discord.Embed(title="📊 Bot Statistics", color=0x9966ff, timestamp=datetime.now())
+    
+    stages = [s['stage'] for s in STAGE_SECONDS.label_sets()]
+    order = ['combined', 'extract', 'search', 'generate', 'total']
+    lines = [f"`{stage}` {_format_timing(STAGE_SECONDS, stage=stage)}"
+             for stage in sorted(stages, key=lambda s: order.index(s) if s in order else len(order))]
+    embed.add_field(name="⏱️ Pipeline", value='\n'.join(lines) or "No messages processed yet", inline=False)
+    
+    lines = []
+    for stage in sorted({labels['stage'] for labels in MODEL_CALLS.label_sets()}):
+        ok = MODEL_CALLS.value(stage=stage, status='ok')
+        failed = MODEL_CALLS.value(stage=stage, status='error')
+        tokens_in = MODEL_TOKENS.value(stage=stage, direction='input')
+        tokens_out = MODEL_TOKENS.value(stage=stage, direction='output')
+        fallbacks = MODEL_FALLBACKS.value(stage=stage)
+        line = (f"`{stage}` {ctx.bot.gemini.client.stage_model(stage)} • {ok:.0f} ok / {failed:.0f} failed • "
+                f"{tokens_in:.0f} in / {tokens_out:.0f} out tokens")
+        lines.append(line + (f" • {fallbacks:.0f} fallback" if fallbacks else ""))
+    resilience = ctx.bot.gemini.client.resilience
+    if lines:
+        lines.append(f"Breaker {resilience.breaker.state} • {resilience.retries} retries • "
+                     f"{resilience.hedges} hedges ({resilience.hedge_wins} won)")
+    embed.add_field(name="🤖 Gemini", value='\n'.join(lines) or "No model calls yet", inline=False)
+    
+    lines = []
+    caches = [('context', ctx.bot.memory.context_cache), ('search', ctx.bot.gemini.search_cache)]
+    for name, cache in caches:
+        if cache:
+            stats = cache.get_stats()
+            lookups = stats['hits'] + stats['misses']
+            rate = stats['hits'] / lookups if lookups else 0.0
+            lines.append(f"`{name}` {rate:.0%} hit rate • {stats['entries']} entries")
+    if ctx.bot.memory.vector_index:
+        lines.append(f"`vector index` {ctx.bot.memory.vector_index.count} exchanges")
+    embed.add_field(name="💾 Caches", value='\n'.join(lines), inline=False)
+    
+    lines = [f"`{labels['op']}` {_format_timing(DB_SECONDS, **labels)}"
+             for labels in DB_SECONDS.label_sets()]
+    lines += [f"`send:{labels['kind']}` {_format_timing(SEND_SECONDS, **labels)}"
+              for labels in SEND_SECONDS.label_sets()]
+    if lines:
+        embed.add_field(name="🗄️ Database & Discord", value='\n'.join(lines)[:1024], inline=False)
+    
+    queue = ctx.bot.scheduler.get_stats()
+    outbound = ctx.bot.outbound.get_stats()
+    embed.add_field(
+        name="📥 Queue",
+        value=(f"{queue['depth']} waiting • wait p95 {queue['wait_p95']:.2f}s • "
+               f"{queue['shed']} shed • {queue['rejected']} rejected • "
+               f"{ERRORS.total():.0f} errors\n"
+               f"Outbound: {outbound['queued']} queued • {outbound['sent']} sent • "
+               f"{outbound['merged'] + outbound['coalesced_edits']} merged • "
+               f"{outbound['rate_limited']} rate limited"),
+        inline=False
+    )
+    await ctx.reply(embed=embed)
+
 @commands.command(name='help')
 async def help_command(ctx):
     """Show help information"""
@@ -278,6 +618,8 @@ async def help_command(ctx):
         value="""
         `!search <query>` - Manual web search
         `!logs [date]` - Get conversation logs
+        `!history <terms>` - Search past conversations
+        `!stats` - Show performance statistics
         `!monitor [on/off/status]` - Manage channel monitoring
         `!help` - Show this help message
         """,
@@ -291,6 +633,7 @@ async def help_command(ctx):
         `!logs yesterday` - Yesterday's logs
         `!logs 2024-01-15` - Specific date
         `!logs 7days` - Last 7 days
+        `!logs 30days export` - Download as a file
         """,
         inline=False
     )
@@ -299,11 +642,14 @@ async def help_command(ctx):
     await ctx.reply(embed=embed)
 
 # Add commands to bot
-def setup_bot():
-    bot = GeminiDiscordBot()
+def setup_bot(shard_ids: Optional[List[int]] = None, shard_count: Optional[int] = None,
+              process_index: int = 0):
+    bot = GeminiDiscordBot(shard_ids=shard_ids, shard_count=shard_count, process_index=process_index)
     bot.add_command(manual_search)
     bot.add_command(get_logs)
+    bot.add_command(search_history)
     bot.add_command(toggle_monitoring)
+    bot.add_command(show_stats)
     bot.add_command(help_command)
     return bot
 
@@ -0,0 +1,185 @@
+import abc
+import gzip
+import math
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+from conversation_memory import ConversationMemory
+
+def _truncate(text: str, length: int = 100) -> str:
+    return f"{text[:length]}{'...' if len(text) > length else ''}"
+
+def format_log_entry(log: Dict) -> str:
+    """Render one conversation for a log embed"""
+    timestamp = datetime.fromisoformat(log['timestamp']).strftime('%H:%M:%S')
+    lines = [f"**{timestamp}** <@{log['user_id']}>: {_truncate(log['message'])}"]
+    if log['response']:
+        lines.append(f"🤖: {_truncate(log['response'])}")
+    return '\n'.join(lines)
+
+class PagedView(discord.ui.View, abc.ABC):
+    """Previous/next buttons that only the requesting user can press.
+
+    Subclasses fetch the current page in load_page() (setting `total`) and
+    render it in embed(); the buttons are disabled on the first and last
+    pages and once the view times out.
+    """
+
+    denied_message = "Only the person who made this request can page through it."
+
+    def __init__(self, author_id: int, page_size: int, timeout: float = 300):
+        super().__init__(timeout=timeout)
+        self.author_id = author_id
+        self.page_size = page_size
+        self.page = 0
+        self.total = 0
+        self.message: Optional[discord.Message] = None
+
+    @property
+    def page_count(self) -> int:
+        return max(1, math.ceil(self.total / self.page_size))
+
+    @abc.abstractmethod
+    async def load_page(self):
+        """Fetch the rows for self.page and set self.total"""
+
+    @abc.abstractmethod
+    def embed(self) -> discord.Embed:
+        """Render the loaded page"""
+
+    async def load(self):
+        """Fetch the current page and update the buttons"""
+        await self.load_page()
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page + 1 >= self.page_count
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message(self.denied_message, ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(0, self.page - 1)
+        await self.load()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = min(self.page + 1, self.page_count - 1)
+        await self.load()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+class LogPaginator(PagedView):
+    """Paged view over a range of logs, fetching one page per click.
+
+    Pages are read with keyset cursors; the cursor for every page reached so
+    far is kept, so going back never rescans earlier rows.
+    """
+
+    denied_message = "Only the person who requested these logs can page through them."
+
+    def __init__(self, memory: ConversationMemory, channel_id: str, start_date: datetime,
+                 end_date: datetime, title: str, total: int, author_id: int,
+                 page_size: int = 10, timeout: float = 300):
+        super().__init__(author_id, page_size, timeout)
+        self.memory = memory
+        self.channel_id = channel_id
+        self.start_date = start_date
+        self.end_date = end_date
+        self.title = title
+        self.total = total
+        self.logs: List[Dict] = []
+        self._cursors: List[Optional[Tuple[int, int]]] = [None]
+
+    async def load_page(self):
+        self.logs = await self.memory.get_logs_page(
+            self.channel_id, self.start_date, self.end_date,
+            after=self._cursors[self.page], limit=self.page_size
+        )
+        if len(self.logs) < self.page_size:
+            # A short page is the last one, even if rows were deleted since counting
+            self.total = self.page * self.page_size + len(self.logs)
+        elif self.page + 1 == len(self._cursors):
+            last = self.logs[-1]
+            self._cursors.append((last['ts'], last['id']))
+
+    def embed(self) -> discord.Embed:
+        embed = discord.Embed(
+            title=f"📋 {self.title}",
+            description='\n\n'.join(format_log_entry(log) for log in self.logs),
+            color=0x0099ff,
+            timestamp=datetime.now()
+        )
+        embed.set_footer(text=f"Page {self.page + 1}/{self.page_count} • {self.total} conversations found")
+        return embed
+
+class HistoryPaginator(PagedView):
+    """Paged view over ranked !history results, fetching one page per click"""
+
+    denied_message = "Only the person who ran this search can page through it."
+
+    def __init__(self, memory: ConversationMemory, channel_id: str, terms: str,
+                 author_id: int, page_size: int = 5, timeout: float = 300):
+        super().__init__(author_id, page_size, timeout)
+        self.memory = memory
+        self.channel_id = channel_id
+        self.terms = terms
+        self.results: List[Dict] = []
+
+    async def load_page(self):
+        self.results, self.total = await self.memory.search_history(
+            self.channel_id, self.terms,
+            limit=self.page_size, offset=self.page * self.page_size
+        )
+
+    def embed(self) -> discord.Embed:
+        embed = discord.Embed(
+            title=f"🔎 History: {_truncate(self.terms, 50)}",
+            color=0x9966ff,
+            timestamp=datetime.now()
+        )
+        for result in self.results:
+            timestamp = datetime.fromisoformat(result['timestamp']).strftime('%Y-%m-%d %H:%M')
+            value = f"<@{result['user_id']}>: {_truncate(result['message'])}"
+            if result['response']:
+                value += f"\n🤖: {_truncate(result['response'], 300)}"
+            if result['snippet']:
+                value += f"\n> {result['snippet']}"
+            embed.add_field(name=timestamp, value=_truncate(value, 1000), inline=False)
+        embed.set_footer(text=f"Page {self.page + 1}/{self.page_count} • {self.total} matches")
+        return embed
+
+async def export_logs(memory: ConversationMemory, channel_id: str, start_date: datetime,
+                      end_date: datetime) -> Tuple[tempfile.SpooledTemporaryFile, int]:
+    """Stream a range of logs into a gzip'd text file and return it with the row count.
+
+    Rows are written page by page as they are read, so the range is never
+    held in memory; the file spills to disk once it grows past a few MB.
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+    count = 0
+    with gzip.GzipFile(fileobj=output, mode='wb') as gz:
+        async for log in memory.iter_logs(channel_id, start_date, end_date):
+            lines = [f"[{log['timestamp']}] {log['user_id']}: {log['message']}"]
+            if log['response']:
+                lines.append(f"Bot: {log['response']}")
+            if log['search_query']:
+                lines.append(f"Search: {log['search_query']}")
+            gz.write(('\n'.join(lines) + '\n\n').encode('utf-8'))
+            count += 1
+    output.seek(0)
+    return output, count
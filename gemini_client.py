@@ -0,0 +1,209 @@
+import google.generativeai as genai
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from metrics import MODEL_CALLS, MODEL_FALLBACKS, record_usage
+from rate_limiter import TokenBucket
+from resilience import CircuitOpenError, ResilientCaller, is_retryable
+
+# Model calls made on behalf of the current request; tasks spawned from it share the list
+_call_counter: ContextVar[Optional[List[int]]] = ContextVar('gemini_call_counter', default=None)
+
+def track_calls() -> List[int]:
+    """Start counting model calls made from the current context; read counter[0]"""
+    counter = [0]
+    _call_counter.set(counter)
+    return counter
+
+def _count_call():
+    counter = _call_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+class GeminiClient:
+    """Async Gemini model client with a global concurrency limit and per-call timeouts.
+
+    `routes` maps a stage name to {'model': ..., 'generation_config': ...};
+    stages without a route use the default model. While the client is
+    saturated, calls move to `fallback_model`, which answers faster.
+    Calls go through `resilience` for retries, hedging and the circuit breaker.
+    """
+
+    def __init__(self, model_name: str, generation_config: Dict = None,
+                 max_concurrency: int = 4, timeout: float = 30.0,
+                 rate_limiter: Optional[TokenBucket] = None,
+                 routes: Optional[Dict[str, Dict]] = None,
+                 fallback_model: Optional[str] = None, fallback_load: float = 1.0,
+                 resilience: Optional[ResilientCaller] = None):
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self._models: Dict[str, genai.GenerativeModel] = {}
+        self.model = self._get_model(model_name)
+        self.routes = routes or {}
+        self.fallback_model = fallback_model or None
+        self.fallback_load = fallback_load
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.resilience = resilience or ResilientCaller()
+        self.in_flight = 0
+        self.waiting = 0
+        self.fallbacks = 0
+        # The client is built before bot.run() starts its loop, and before
+        # Python 3.10 a semaphore binds to the loop current at construction
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _get_model(self, model_name: str) -> genai.GenerativeModel:
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models[model_name] = genai.GenerativeModel(
+                model_name=model_name,
+                generation_config=self.generation_config
+            )
+        return model
+
+    def load(self) -> float:
+        """Running plus queued calls, relative to the concurrency limit"""
+        return (self.in_flight + self.waiting) / self.max_concurrency
+
+    def stage_model(self, stage: str) -> str:
+        """The model configured for a stage, before any fallback"""
+        return self.routes.get(stage, {}).get('model') or self.model_name
+
+    def route(self, stage: str, generation_config: Dict = None) -> Tuple[genai.GenerativeModel, Optional[Dict]]:
+        """Pick the model and generation config for a call, dropping to the fallback tier under load"""
+        model_name = self.stage_model(stage)
+        if (self.fallback_model and model_name != self.fallback_model
+                and self.load() >= self.fallback_load):
+            model_name = self.fallback_model
+            self.fallbacks += 1
+            MODEL_FALLBACKS.inc(stage=stage)
+        
+        # Per-call settings (e.g. a response MIME type) layer over the stage's
+        stage_config = self.routes.get(stage, {}).get('generation_config')
+        if stage_config:
+            generation_config = {**stage_config, **(generation_config or {})}
+        return self._get_model(model_name), generation_config
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Wait for the rate limiter and a concurrency slot, counting the call as queued meanwhile"""
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        try:
+            if self.rate_limiter:
+                await self.rate_limiter.acquire()
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    async def generate(self, prompt: str, timeout: Optional[float] = None,
+                       generation_config: Dict = None, stage: str = 'other',
+                       deadline: Optional[float] = None):
+        """Run generate_content without blocking the event loop.
+        
+        Transient failures are retried until `deadline` (a time.monotonic()
+        value); raises CircuitOpenError while the API is considered down.
+        """
+        model, generation_config = self.route(stage, generation_config)
+        
+        async def attempt(attempt_timeout: float):
+            _count_call()
+            async with self._slot():
+                try:
+                    response = await asyncio.wait_for(
+                        model.generate_content_async(prompt, generation_config=generation_config),
+                        timeout=attempt_timeout
+                    )
+                except Exception:
+                    MODEL_CALLS.inc(stage=stage, status='error')
+                    raise
+            
+            MODEL_CALLS.inc(stage=stage, status='ok')
+            record_usage(stage, response)
+            return response
+        
+        # Duplicating calls while saturated would only lengthen the queue
+        return await self.resilience.call(stage, attempt, timeout or self.timeout,
+                                          deadline=deadline, hedge=self.load() < 1)
+
+    async def stream(self, prompt: str, timeout: Optional[float] = None,
+                     stage: str = 'other', deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """Yield response text incrementally; the timeout applies to each chunk.
+        
+        `deadline` (a time.monotonic() value) caps the wait for the first
+        text; once text is flowing the answer is allowed to finish. Streams
+        are not retried, since text may already have been shown, but they
+        respect and feed the circuit breaker.
+        """
+        if deadline is not None and deadline <= time.monotonic():
+            raise asyncio.TimeoutError("Deadline passed before the model call")
+        breaker = self.resilience.breaker
+        if not breaker.allow():
+            raise CircuitOpenError("Gemini API circuit breaker is open")
+        # From here on the breaker must hear how the call ended, including a
+        # cancellation while waiting for a slot, or a half-open probe never finishes
+        try:
+            model, generation_config = self.route(stage)
+            _count_call()
+            timeout = timeout or self.timeout
+            produced = False
+            
+            def wait_limit() -> float:
+                if produced or deadline is None:
+                    return timeout
+                return min(timeout, deadline - time.monotonic())
+            
+            async with self._slot():
+                try:
+                    response = await asyncio.wait_for(
+                        model.generate_content_async(prompt, generation_config=generation_config, stream=True),
+                        timeout=wait_limit()
+                    )
+                    chunks = response.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=wait_limit())
+                        except StopAsyncIteration:
+                            break
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            # Chunks without text parts (e.g. a bare finish reason)
+                            continue
+                        if text:
+                            produced = True
+                            yield text
+                except Exception:
+                    MODEL_CALLS.inc(stage=stage, status='error')
+                    raise
+        except Exception as e:
+            if is_retryable(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        except BaseException:
+            # Cancelled, or the consumer stopped reading
+            breaker.record_abandoned()
+            raise
+        
+        breaker.record_success()
+        MODEL_CALLS.inc(stage=stage, status='ok')
+        # Usage metadata arrives with the last chunk
+        record_usage(stage, response)
@@ -1,38 +1,132 @@
 import google.generativeai as genai
 import aiohttp
 import asyncio
-from typing import List, Dict, Optional
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple
 import json
 import re
+import time
+
+from config import Config
+from gemini_client import GeminiClient, track_calls
+from metrics import DEGRADED, ERRORS, SEARCHES_DROPPED, STAGE_SECONDS
+from pipeline_stats import PipelineStats
+from prompt_builder import PromptBuilder
+from rate_limiter import TokenBucket
+from resilience import CircuitBreaker, ResilientCaller
+from search_cache import SearchCache, normalize_query
+from singleflight import SingleFlight
+from storage import StorageEngine
+
+# Words that only make sense with the earlier conversation in view
+_CONTEXT_REFERENCES = re.compile(
+    r"\b(it|its|that|this|these|those|they|them|he|she|him|her|there|same|above|previous)\b"
+    r"|それ|あれ|これ|その|あの|この|さっき|前の",
+    re.IGNORECASE
+)
+
+def looks_like_query(message: str, context: List[Dict] = None) -> bool:
+    """Cheap local check for messages that can be searched as-is, skipping extraction"""
+    text = message.strip()
+    if '\n' in text or not 3 < len(text) <= 120:
+        return False
+    if len(text.split()) > 16:
+        return False
+    if text.count('?') + text.count('？') > 1:  # Several questions need several queries
+        return False
+    if context and _CONTEXT_REFERENCES.search(text):
+        return False
+    return True
+
+class LatencyBudget:
+    """A per-request latency budget split into stage deadlines (time.monotonic() values).
+
+    Each stage must be done by its share of the budget, counted from the
+    start of the request; whatever time earlier stages leave unused carries
+    over to later ones.
+    """
+    
+    SHARES = {'extract': 0.2, 'combined': 0.5, 'search': 0.5, 'generate': 1.0}
+    
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.started = time.monotonic()
+    
+    def deadline(self, stage: str) -> float:
+        return self.started + self.seconds * self.SHARES.get(stage, 1.0)
+
+def _deadline(budget: Optional[LatencyBudget], stage: str) -> Optional[float]:
+    return budget.deadline(stage) if budget else None
 
 class GeminiSearchBot:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, max_concurrency: int = None, timeout: float = None,
+                 storage: Optional[StorageEngine] = None):
         self.api_key = api_key
         genai.configure(api_key=api_key)
         
-        # Configure Gemini 2.5 Flash model
-        self.model = genai.GenerativeModel(
-            model_name="gemini-2.5-flash",
-            generation_config={
-                "temperature": 0.7,
-                "top_p": 0.8,
-                "top_k": 40,
-                "max_output_tokens": 2048,
-            }
+        # Shared requests-per-minute budget for all Gemini traffic
+        self.rate_limiter = None
+        if Config.GEMINI_RPM > 0:
+            self.rate_limiter = TokenBucket(Config.GEMINI_RPM, Config.GEMINI_RPM_BURST)
+        
+        # Each stage gets its own model tier and generation config from Config
+        self.client = GeminiClient(
+            model_name=Config.GEMINI_MODEL,
+            generation_config=Config.get_gemini_config(),
+            max_concurrency=max_concurrency or Config.GEMINI_MAX_CONCURRENCY,
+            timeout=timeout or Config.GEMINI_TIMEOUT,
+            rate_limiter=self.rate_limiter,
+            routes={stage: Config.get_stage_config(stage) for stage in Config.PIPELINE_STAGES},
+            fallback_model=Config.GEMINI_FALLBACK_MODEL,
+            fallback_load=Config.MODEL_FALLBACK_LOAD,
+            resilience=ResilientCaller(
+                max_retries=Config.GEMINI_MAX_RETRIES,
+                base_delay=Config.RETRY_BASE_DELAY,
+                max_delay=Config.RETRY_MAX_DELAY,
+                retry_budget=Config.RETRY_BUDGET,
+                hedge=Config.HEDGE_REQUESTS,
+                hedge_budget=Config.HEDGE_BUDGET,
+                breaker=CircuitBreaker(Config.BREAKER_FAILURES, Config.BREAKER_RESET_SECONDS)
+            )
+        )
+        self.model = self.client.model
+        
+        # Search results shared across users and restarts
+        self.search_cache = None
+        if Config.SEARCH_CACHE_TTL > 0:
+            self.search_cache = SearchCache(
+                db_path=Config.DATABASE_PATH,
+                max_entries=Config.SEARCH_CACHE_SIZE,
+                ttl_seconds=Config.SEARCH_CACHE_TTL,
+                storage=storage,
+                stale_seconds=Config.SEARCH_CACHE_STALE_SECONDS
+            )
+        
+        # Identical searches (and optionally whole messages) in flight share one call
+        self.search_flight = SingleFlight()
+        self.message_flight = SingleFlight()
+        self.coalesce_messages = Config.COALESCE_MESSAGES
+        
+        # 'full', 'heuristic' (skip extraction for query-like messages) or 'combined'
+        self.pipeline_mode = Config.PIPELINE_MODE
+        self.pipeline_stats = PipelineStats()
+        
+        # Shared prompt assembly with per-section token budgets
+        self.prompts = PromptBuilder(
+            context_budget=Config.CONTEXT_TOKEN_BUDGET,
+            search_budget=Config.SEARCH_TOKEN_BUDGET,
+            message_budget=Config.MESSAGE_TOKEN_BUDGET,
+            summary_budget=Config.SUMMARY_TOKEN_BUDGET,
+            summary_recent_turns=Config.SUMMARY_RECENT_TURNS,
+            relevant_budget=Config.RELEVANT_TOKEN_BUDGET
         )
     
-    def extract_search_queries(self, message: str, context: List[Dict] = None) -> List[str]:
+    async def extract_search_queries(self, message: str, context: List[Dict] = None,
+                                     context_str: Optional[str] = None,
+                                     deadline: Optional[float] = None) -> List[str]:
         """Extract search queries from the message and context"""
-        # Create context string if available
-        context_str = ""
-        if context:
-            recent_messages = []
-            for conv in context[-5:]:  # Last 5 conversations for context
-                if conv.get('message'):
-                    recent_messages.append(f"User: {conv['message']}")
-                if conv.get('response'):
-                    recent_messages.append(f"Bot: {conv['response'][:100]}...")
-            context_str = "\n".join(recent_messages)
+        # Create context string if the caller hasn't built it already
+        if context_str is None:
+            context_str = self.prompts.build_context(context)
         
         # Prompt to extract search queries
         prompt = f"""
@@ -41,7 +135,7 @@ class GeminiSearchBot:
         Context (recent conversation):
         {context_str}
 
-        Current message: {message}
+        Current message: {self.prompts.build_message(message)}
 
         Please provide search queries that are:
         1. Specific and targeted
@@ -51,9 +145,10 @@ class GeminiSearchBot:
 
         Return only the search queries, one per line, without any additional text or formatting.
         """
+        self.prompts.record('extract', prompt)
         
         try:
-            response = self.model.generate_content(prompt)
+            response = await self.client.generate(prompt, stage='extract', deadline=deadline)
             search_queries = []
             
             if response.text:
@@ -70,15 +165,33 @@ class GeminiSearchBot:
             return search_queries[:3]  # Limit to 3 queries
             
         except Exception as e:
-            print(f"Error extracting search queries: {e}")
+            ERRORS.inc(component='extract')
+            print(f"Error extracting search queries, searching the message as written: {e}")
             # Fallback: use the message as a search query
+            DEGRADED.inc(stage='extract')
             return [message] if len(message) > 3 else []
     
     async def search_web(self, query: str) -> Dict:
+        """Perform web search, sharing the call with identical searches already in flight"""
+        result = await self.search_flight.do(
+            normalize_query(query), lambda: self._search_web(query)
+        )
+        return dict(result, query=query)
+    
+    async def _search_web(self, query: str) -> Dict:
         """Perform web search using Google Custom Search API alternative"""
         # Note: This is a simplified search function
         # In production, you'd use Google Custom Search API or other search services
         
+        if self.search_cache:
+            cached = await self.search_cache.get(query)
+            if cached is not None:
+                return {
+                    'query': query,
+                    'results': cached,
+                    'success': True
+                }
+        
         search_prompt = f"""
         I need you to act as a web search engine. Based on this search query: "{query}"
         
@@ -90,41 +203,102 @@ class GeminiSearchBot:
         
         Format your response as if you're providing search results with relevant, up-to-date information.
         """
+        self.prompts.record('search', search_prompt)
         
         try:
-            response = self.model.generate_content(search_prompt)
+            response = await self.client.generate(search_prompt, stage='search')
+            if response.text and self.search_cache:
+                await self.search_cache.set(query, response.text)
             return {
                 'query': query,
                 'results': response.text if response.text else "No results found",
                 'success': True
             }
         except Exception as e:
+            ERRORS.inc(component='search')
+            # Expired results beat none while the model is unavailable
+            stale = await self.search_cache.get_stale(query) if self.search_cache else None
+            if stale is not None:
+                DEGRADED.inc(stage='search')
+                return {
+                    'query': query,
+                    'results': stale,
+                    'success': True,
+                    'stale': True
+                }
             return {
                 'query': query,
                 'results': f"Search error: {str(e)}",
                 'success': False
             }
     
-    async def generate_response(self, message: str, search_results: List[Dict], 
-                              context: List[Dict] = None) -> str:
-        """Generate a comprehensive response based on search results and context"""
+    async def extract_and_search(self, message: str, context: List[Dict] = None,
+                                 context_str: Optional[str] = None,
+                                 deadline: Optional[float] = None) -> Optional[List[Dict]]:
+        """Extract search queries and produce their results in one structured-output call.
+        
+        Returns search results in the same shape as search_web, or None if the
+        call failed and the caller should fall back to the full pipeline.
+        """
+        if context_str is None:
+            context_str = self.prompts.build_context(context)
+        
+        prompt = f"""
+        Based on this conversation context and the current message, decide on 1-3 specific web search queries that would help answer the user's question, then act as a web search engine and provide the information that would typically be found for each query.
+
+        Context (recent conversation):
+        {context_str}
+
+        Current message: {self.prompts.build_message(message)}
+
+        For each query, include current and relevant information, multiple perspectives if applicable, recent developments or news, and factual data and statistics when available.
+
+        Respond with JSON only, in this format:
+        {{"searches": [{{"query": "search query", "results": "search results text"}}]}}
+        """
+        self.prompts.record('combined', prompt)
+        
+        try:
+            response = await self.client.generate(
+                prompt,
+                generation_config={"response_mime_type": "application/json"},
+                stage='combined',
+                deadline=deadline
+            )
+            data = json.loads(response.text)
+            
+            search_results = []
+            for item in data.get('searches', [])[:3]:
+                query = str(item.get('query', '')).strip()
+                results = str(item.get('results', '')).strip()
+                if query and results:
+                    search_results.append({
+                        'query': query,
+                        'results': results,
+                        'success': True
+                    })
+            
+            if self.search_cache:
+                for result in search_results:
+                    await self.search_cache.set(result['query'], result['results'])
+            
+            return search_results or None
+            
+        except Exception as e:
+            ERRORS.inc(component='combined')
+            print(f"Error in combined query extraction and search: {e}")
+            return None
+    
+    def build_response_prompt(self, message: str, search_results: List[Dict], 
+                              context: List[Dict] = None, context_str: Optional[str] = None) -> str:
+        """Build the prompt for the final answer from search results and context"""
         
         # Prepare context string
-        context_str = ""
-        if context:
-            recent_messages = []
-            for conv in context[-3:]:  # Last 3 conversations
-                if conv.get('message'):
-                    recent_messages.append(f"User: {conv['message']}")
-                if conv.get('response'):
-                    recent_messages.append(f"Assistant: {conv['response'][:150]}...")
-            context_str = "\n".join(recent_messages)
-        
-        # Prepare search results string
-        search_info = ""
-        for i, result in enumerate(search_results, 1):
-            if result.get('success'):
-                search_info += f"\nSearch Query {i}: {result['query']}\nResults: {result['results']}\n"
+        if context_str is None:
+            context_str = self.prompts.build_context(context)
+        
+        # Prepare search results, trimmed by relevance to fit the budget
+        search_info = self.prompts.build_search_info(message, search_results)
         
         # Generate comprehensive response
         response_prompt = f"""
@@ -133,7 +307,7 @@ class GeminiSearchBot:
         Conversation Context:
         {context_str}
 
-        Current User Message: {message}
+        Current User Message: {self.prompts.build_message(message)}
 
         Web Search Information:
         {search_info}
@@ -148,40 +322,196 @@ class GeminiSearchBot:
 
         If the search results don't contain relevant information, acknowledge this and provide what helpful information you can based on your knowledge.
         """
+        self.prompts.record('generate', response_prompt)
+        
+        return response_prompt
+    
+    async def generate_response(self, message: str, search_results: List[Dict], 
+                              context: List[Dict] = None, context_str: Optional[str] = None,
+                              deadline: Optional[float] = None) -> str:
+        """Generate a comprehensive response based on search results and context"""
+        response_prompt = self.build_response_prompt(message, search_results, context, context_str)
         
         try:
-            response = self.model.generate_content(response_prompt)
+            response = await self.client.generate(response_prompt, stage='generate', deadline=deadline)
             return response.text if response.text else "I apologize, but I couldn't generate a proper response at this time."
             
         except Exception as e:
-            return f"I encountered an error while processing your request: {str(e)}. Please try again."
+            ERRORS.inc(component='generate')
+            print(f"Error generating response: {e}")
+            return self.degraded_response(search_results)
     
-    async def process_message(self, message: str, context: List[Dict] = None) -> Dict:
-        """Process a message end-to-end: extract queries, search, and generate response"""
+    def degraded_response(self, search_results: List[Dict], partial: bool = False) -> str:
+        """Answer without the model, from whatever search results are at hand"""
+        DEGRADED.inc(stage='generate')
+        if partial:
+            return "⚠️ The answer was cut short because Gemini stopped responding."
         
-        # Extract search queries
-        search_queries = self.extract_search_queries(message, context)
+        usable = [result for result in search_results if result.get('success')]
+        if not usable:
+            return "⚠️ Gemini is temporarily unavailable, so I can't answer right now. Please try again in a minute."
         
-        if not search_queries:
-            return {
-                'response': "I'm not sure what to search for. Could you please be more specific?",
-                'search_queries': [],
-                'search_results': []
-            }
+        parts = ["⚠️ Gemini is temporarily unavailable, so here is what I found without a full answer:"]
+        for result in usable[:3]:
+            excerpt = result['results'].strip()
+            if len(excerpt) > 500:
+                excerpt = excerpt[:500].rsplit(None, 1)[0] + " …"
+            label = " (cached)" if result.get('stale') else ""
+            parts.append(f"**{result['query']}**{label}\n{excerpt}")
+        return "\n\n".join(parts)
+    
+    async def generate_response_stream(self, message: str, search_results: List[Dict], 
+                                       context: List[Dict] = None,
+                                       context_str: Optional[str] = None,
+                                       deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """Like generate_response, but yield the answer incrementally as it is generated"""
+        response_prompt = self.build_response_prompt(message, search_results, context, context_str)
+        
+        produced = False
+        try:
+            async for text in self.client.stream(response_prompt, stage='generate', deadline=deadline):
+                produced = True
+                yield text
+            if not produced:
+                yield "I apologize, but I couldn't generate a proper response at this time."
+                
+        except Exception as e:
+            ERRORS.inc(component='generate')
+            print(f"Error streaming response: {e}")
+            prefix = "\n\n" if produced else ""
+            yield prefix + self.degraded_response(search_results, partial=produced)
+    
+    async def search_within(self, queries: List[str],
+                            deadline: Optional[float] = None) -> Tuple[List[Dict], List[str]]:
+        """Run searches concurrently until deadline; cancel the late ones and return their queries"""
+        tasks = [asyncio.ensure_future(self.search_web(query)) for query in queries]
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        
+        search_results, dropped = [], []
+        for query, task in zip(queries, tasks):
+            if task in done:
+                search_results.append(task.result())
+            else:
+                dropped.append(query)
+        if dropped:
+            SEARCHES_DROPPED.inc(len(dropped))
+        return search_results, dropped
+    
+    async def process_message(self, message: str, context: List[Dict] = None,
+                              on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+                              budget: Optional[float] = None, summary: Optional[Dict] = None,
+                              relevant: Optional[List[Dict]] = None) -> Dict:
+        """Process a message end-to-end: extract queries, search, and generate response.
+        
+        When on_chunk is given the answer is streamed and on_chunk is awaited
+        with each new piece of text as it arrives. `budget` is the latency
+        target in seconds: searches still running at their stage deadline are
+        dropped and the answer is written from the results that arrived.
+        A rolling `summary` of the conversation stands in for older context,
+        and `relevant` holds earlier exchanges similar to this message.
+        """
+        if not self.coalesce_messages:
+            return await self._process_message(message, context, on_chunk, budget, summary, relevant)
+        
+        # Coalescing by message text deliberately ignores per-user context
+        key = normalize_query(message)
+        shared = self.message_flight.is_in_flight(key)
+        result = await self.message_flight.do(
+            key, lambda: self._process_message(message, context, on_chunk, budget, summary, relevant)
+        )
+        if shared and on_chunk:
+            await on_chunk(result['response'])
+        return dict(result, model_calls=0 if shared else result['model_calls'])
+    
+    async def _process_message(self, message: str, context: List[Dict] = None,
+                               on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+                               budget: Optional[float] = None, summary: Optional[Dict] = None,
+                               relevant: Optional[List[Dict]] = None) -> Dict:
+        started = time.monotonic()
+        calls = track_calls()
+        budget = LatencyBudget(budget) if budget else None
+        dropped: List[str] = []
+        
+        # Context is rendered once and shared by every stage of this request
+        context_str = self.prompts.build_context(context, summary, relevant)
+        
+        search_results = None
+        if self.pipeline_mode == 'combined':
+            path = 'combined'
+            with STAGE_SECONDS.time(stage='combined'):
+                search_results = await self.extract_and_search(
+                    message, context, context_str, deadline=_deadline(budget, 'combined')
+                )
+            search_queries = [result['query'] for result in search_results or []]
         
-        # Perform searches
-        search_results = []
-        for query in search_queries:
-            result = await self.search_web(query)
-            search_results.append(result)
-            # Small delay to avoid rate limiting
-            await asyncio.sleep(0.5)
+        if search_results is None:
+            # Extract search queries, unless the message can be searched as written
+            if self.pipeline_mode == 'heuristic' and looks_like_query(message, context):
+                path = 'direct'
+                search_queries = [message.strip()]
+            else:
+                path = 'full'
+                with STAGE_SECONDS.time(stage='extract'):
+                    search_queries = await self.extract_search_queries(
+                        message, context, context_str, deadline=_deadline(budget, 'extract')
+                    )
+            
+            if not search_queries:
+                latency = time.monotonic() - started
+                self.pipeline_stats.record(path, calls[0], latency)
+                STAGE_SECONDS.observe(latency, stage='total')
+                return {
+                    'response': "I'm not sure what to search for. Could you please be more specific?",
+                    'search_queries': [],
+                    'search_results': [],
+                    'dropped_queries': [],
+                    'pipeline_path': path,
+                    'model_calls': calls[0],
+                    'latency': latency
+                }
+            
+            # Perform searches concurrently; the shared rate limiter paces them
+            with STAGE_SECONDS.time(stage='search'):
+                search_results, dropped = await self.search_within(
+                    search_queries, deadline=_deadline(budget, 'search')
+                )
         
         # Generate response
-        response = await self.generate_response(message, search_results, context)
+        with STAGE_SECONDS.time(stage='generate'):
+            if on_chunk:
+                parts = []
+                async for text in self.generate_response_stream(
+                    message, search_results, context, context_str, deadline=_deadline(budget, 'generate')
+                ):
+                    parts.append(text)
+                    await on_chunk(text)
+                response = ''.join(parts)
+            else:
+                response = await self.generate_response(
+                    message, search_results, context, context_str, deadline=_deadline(budget, 'generate')
+                )
+        
+        if dropped:
+            note = "\n\n*⏱️ Answered without the searches that ran too long: " + ", ".join(dropped) + "*"
+            response += note
+            if on_chunk:
+                await on_chunk(note)
+        
+        latency = time.monotonic() - started
+        self.pipeline_stats.record(path, calls[0], latency)
+        STAGE_SECONDS.observe(latency, stage='total')
         
         return {
             'response': response,
             'search_queries': search_queries,
-            'search_results': search_results
+            'search_results': search_results,
+            'dropped_queries': dropped,
+            'pipeline_path': path,
+            'model_calls': calls[0],
+            'latency': latency
         }
\ No newline at end of file
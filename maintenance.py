@@ -0,0 +1,122 @@
+import asyncio
+import gzip
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from conversation_memory import ConversationMemory
+from search_cache import SearchCache
+from summarizer import ConversationSummarizer
+
+class ConversationArchiver:
+    """Appends expired conversation rows to gzip'd JSON-lines files, one per month"""
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = archive_dir
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def __call__(self, rows: List[tuple]):
+        by_month: Dict[str, List[tuple]] = {}
+        for row in rows:
+            month = datetime.fromtimestamp(row[6]).strftime('%Y-%m')
+            by_month.setdefault(month, []).append(row)
+
+        for month, month_rows in by_month.items():
+            path = os.path.join(self.archive_dir, f"conversations-{month}.jsonl.gz")
+            # Appending adds a new gzip member; readers see one continuous stream
+            with gzip.open(path, 'at', encoding='utf-8') as f:
+                for row in month_rows:
+                    f.write(json.dumps({
+                        'id': row[0],
+                        'user_id': row[1],
+                        'channel_id': row[2],
+                        'message': row[3],
+                        'response': row[4],
+                        'search_query': row[5],
+                        'ts': row[6],
+                    }, ensure_ascii=False) + "\n")
+
+class MaintenanceTask:
+    """Background upkeep: retention deletes, incremental vacuum and ANALYZE"""
+
+    def __init__(self, memory: ConversationMemory, retention_days: int = 30,
+                 interval_hours: float = 6, batch_size: int = 500, time_budget: float = 10.0,
+                 vacuum_pages: int = 1000, archive_dir: Optional[str] = None,
+                 search_cache: Optional[SearchCache] = None,
+                 summarizer: Optional[ConversationSummarizer] = None):
+        self.memory = memory
+        self.retention_days = retention_days
+        self.interval = interval_hours * 3600
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.vacuum_pages = vacuum_pages
+        self.archiver = ConversationArchiver(archive_dir) if archive_dir else None
+        self.search_cache = search_cache
+        self.summarizer = summarizer
+        self.last_run: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Run maintenance now and then every interval, in the background"""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Error in maintenance: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> Dict:
+        """Run one maintenance pass and return what it did"""
+        started = time.monotonic()
+
+        deleted = await self.memory.cleanup_old_conversations(
+            days_to_keep=self.retention_days,
+            batch_size=self.batch_size,
+            time_budget=self.time_budget,
+            archiver=self.archiver
+        )
+        purged = await self.search_cache.purge_expired() if self.search_cache else 0
+        summaries = await self.summarizer.purge_older_than(self.retention_days) if self.summarizer else 0
+        unindexed = await self.memory.prune_index()
+        freed = await self.memory.storage.run_write(self._vacuum_and_analyze, transactional=False)
+
+        self.last_run = {
+            'deleted': deleted,
+            'archived': deleted if self.archiver else 0,
+            'cache_purged': purged,
+            'summaries_purged': summaries,
+            'index_pruned': unindexed,
+            'pages_freed': freed,
+            'seconds': round(time.monotonic() - started, 3),
+        }
+        print(f"Maintenance: removed {deleted} conversations "
+              f"({self.last_run['archived']} archived), {purged} cached searches, {summaries} summaries, "
+              f"{unindexed} indexed exchanges, "
+              f"freed {freed} pages in {self.last_run['seconds']}s")
+        return self.last_run
+
+    def _vacuum_and_analyze(self, conn: sqlite3.Connection) -> int:
+        freed = 0
+        # auto_vacuum is 2 (INCREMENTAL) only for databases created with it
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # executescript steps the pragma to completion; execute() frees one page
+            conn.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)});")
+            freed = before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # Bounded sampling keeps ANALYZE cheap on large tables
+        conn.execute("PRAGMA analysis_limit = 1000")
+        conn.execute("ANALYZE")
+        return freed
@@ -0,0 +1,248 @@
+import bisect
+import functools
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Seconds; spans cache hits through slow model generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    type = 'counter'
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_key(labels), 0)
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def label_sets(self) -> List[Dict[str, str]]:
+        return [dict(key) for key in self._values]
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in self._values.items()]
+
+class Histogram:
+    """Bucketed distribution with optional labels"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # key -> (per-bucket counts incl. +Inf, count, sum)
+        self._values: Dict[LabelKey, List] = {}
+
+    def observe(self, value: float, **labels):
+        key = _key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += 1
+        entry[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with-block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(_key(labels))
+        return entry[1] if entry else 0
+
+    def mean(self, **labels) -> float:
+        entry = self._values.get(_key(labels))
+        return entry[2] / entry[1] if entry and entry[1] else 0.0
+
+    def quantile(self, q: float, **labels) -> float:
+        """Upper bound of the bucket holding the q-quantile (as Prometheus would estimate)"""
+        entry = self._values.get(_key(labels))
+        if not entry or not entry[1]:
+            return 0.0
+        rank = q * entry[1]
+        seen = 0
+        for bound, count in zip(self.buckets + (math.inf,), entry[0]):
+            seen += count
+            if seen >= rank:
+                return bound if not math.isinf(bound) else self.buckets[-1]
+        return self.buckets[-1]
+
+    def label_sets(self) -> List[Dict[str, str]]:
+        return [dict(key) for key in self._values]
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, count, total) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = "+Inf" if math.isinf(bound) else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+        return lines
+
+class CallbackMetric:
+    """Metric whose samples are read from a callback at scrape time.
+
+    Used to expose counters that components already keep (cache hits,
+    queue depth, ...) without double bookkeeping. The callback returns a
+    list of (labels, value) pairs.
+    """
+
+    def __init__(self, name: str, help: str, type: str,
+                 callback: Callable[[], List[Tuple[Dict[str, object], float]]]):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(_key(labels))} {_format_value(value)}"
+                for labels, value in self.callback()]
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.register(Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def callback(self, name: str, help: str, type: str,
+                 callback: Callable[[], List[Tuple[Dict[str, object], float]]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, type, callback))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.render()
+            except Exception as e:
+                print(f"Error collecting metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'gemini_bot_stage_seconds', 'Latency of process_message stages')
+DB_SECONDS = REGISTRY.histogram(
+    'gemini_bot_db_seconds', 'Latency of ConversationMemory calls')
+SEND_SECONDS = REGISTRY.histogram(
+    'gemini_bot_discord_send_seconds', 'Latency of outbound Discord sends and edits')
+OUTBOUND_WAIT_SECONDS = REGISTRY.histogram(
+    'gemini_bot_outbound_queue_seconds', 'Time from enqueueing a Discord send to it completing')
+RATE_LIMITED = REGISTRY.counter(
+    'gemini_bot_discord_rate_limited_total', '429 responses from Discord by scope')
+MODEL_CALLS = REGISTRY.counter(
+    'gemini_bot_model_calls_total', 'Gemini model calls by stage and outcome')
+MODEL_TOKENS = REGISTRY.counter(
+    'gemini_bot_model_tokens_total', 'Gemini tokens by stage and direction')
+MODEL_FALLBACKS = REGISTRY.counter(
+    'gemini_bot_model_fallbacks_total', 'Gemini calls moved to the fallback model under load, by stage')
+SEARCHES_DROPPED = REGISTRY.counter(
+    'gemini_bot_searches_dropped_total', 'Searches cancelled because they missed the request deadline')
+RETRIES = REGISTRY.counter(
+    'gemini_bot_model_retries_total', 'Gemini calls retried after a transient failure, by stage')
+HEDGES = REGISTRY.counter(
+    'gemini_bot_model_hedges_total', 'Duplicate Gemini calls sent for slow requests, by stage and winner')
+BREAKER_REJECTIONS = REGISTRY.counter(
+    'gemini_bot_breaker_rejections_total', 'Gemini calls refused while the circuit breaker was open')
+DEGRADED = REGISTRY.counter(
+    'gemini_bot_degraded_total', 'Answers or stages served from cache or fallbacks instead of the model')
+ERRORS = REGISTRY.counter(
+    'gemini_bot_errors_total', 'Errors by component')
+
+def timed(histogram: Histogram, **labels):
+    """Decorator observing how long a coroutine function takes"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_usage(stage: str, response) -> None:
+    """Count input/output tokens from a Gemini response's usage metadata"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    MODEL_TOKENS.inc(getattr(usage, 'prompt_token_count', 0) or 0, stage=stage, direction='input')
+    MODEL_TOKENS.inc(getattr(usage, 'candidates_token_count', 0) or 0, stage=stage, direction='output')
+
+class MetricsServer:
+    """Serves REGISTRY on a local HTTP endpoint for Prometheus to scrape"""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY,
+                 host: str = '127.0.0.1', port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"Metrics available at http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
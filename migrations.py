@@ -0,0 +1,183 @@
+import sqlite3
+from typing import Callable, List, Tuple
+
+# Rows converted per transaction when upgrading existing databases in place
+BATCH_SIZE = 5000
+
+def _column_names(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def _create_conversations(conn: sqlite3.Connection):
+    """v1: the original conversations table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            channel_id TEXT NOT NULL,
+            message TEXT NOT NULL,
+            response TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            search_query TEXT
+        )
+    ''')
+
+def _add_epoch_timestamps(conn: sqlite3.Connection):
+    """v2: integer epoch `ts` column, backfilled in batches, plus lookup indexes"""
+    if 'ts' not in _column_names(conn, 'conversations'):
+        conn.execute("ALTER TABLE conversations ADD COLUMN ts INTEGER")
+
+    # CURRENT_TIMESTAMP stored UTC text, which strftime('%s') reads as UTC
+    low, high = conn.execute("SELECT MIN(id), MAX(id) FROM conversations WHERE ts IS NULL").fetchone()
+    if low is not None:
+        print(f"Migrating conversation timestamps for ids {low}-{high}...")
+        for start in range(low, high + 1, BATCH_SIZE):
+            conn.execute("BEGIN")
+            conn.execute('''
+                UPDATE conversations
+                SET ts = COALESCE(CAST(strftime('%s', timestamp) AS INTEGER), 0)
+                WHERE id >= ? AND id < ? AND ts IS NULL
+            ''', (start, start + BATCH_SIZE))
+            conn.execute("COMMIT")
+
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_channel_user_ts
+        ON conversations (channel_id, user_id, ts)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_channel_ts
+        ON conversations (channel_id, ts)
+    ''')
+    # Retention deletes filter on ts alone
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_ts
+        ON conversations (ts)
+    ''')
+
+def _fts5_tokenizer(conn: sqlite3.Connection) -> str:
+    """Prefer trigram (matches inside CJK text, which has no word breaks) when available"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts5(x, tokenize='trigram')")
+        conn.execute("DROP TABLE temp.fts_probe")
+        return 'trigram'
+    except sqlite3.OperationalError:
+        return 'unicode61'
+
+def _add_full_text_index(conn: sqlite3.Connection):
+    """v3: FTS5 index over message, response and search_query, kept in sync by triggers"""
+    resumed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'conversations_fts'"
+    ).fetchone() is not None
+    try:
+        tokenizer = _fts5_tokenizer(conn)
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+                message, response, search_query,
+                content='conversations', content_rowid='id', tokenize='{tokenizer}'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5; !history reports itself unavailable
+        print(f"Full-text search disabled: {e}")
+        return
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations BEGIN
+            INSERT INTO conversations_fts (rowid, message, response, search_query)
+            VALUES (new.id, new.message, new.response, new.search_query);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, message, response, search_query)
+            VALUES ('delete', old.id, old.message, old.response, old.search_query);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_update AFTER UPDATE ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, message, response, search_query)
+            VALUES ('delete', old.id, old.message, old.response, old.search_query);
+            INSERT INTO conversations_fts (rowid, message, response, search_query)
+            VALUES (new.id, new.message, new.response, new.search_query);
+        END
+    ''')
+
+    if resumed:
+        # An interrupted backfill left an unknown subset indexed; rebuild from scratch
+        conn.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild')")
+        return
+
+    # Rows written before the triggers existed are indexed in batches
+    low, high = conn.execute("SELECT MIN(id), MAX(id) FROM conversations").fetchone()
+    if low is not None:
+        print(f"Building full-text index for ids {low}-{high}...")
+        for start in range(low, high + 1, BATCH_SIZE):
+            conn.execute("BEGIN")
+            conn.execute('''
+                INSERT INTO conversations_fts (rowid, message, response, search_query)
+                SELECT id, message, response, search_query
+                FROM conversations
+                WHERE id >= ? AND id < ?
+            ''', (start, start + BATCH_SIZE))
+            conn.execute("COMMIT")
+
+def _add_monitored_channels(conn: sqlite3.Connection):
+    """v4: auto-search channels, shared by every shard process and kept across restarts"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS monitored_channels (
+            channel_id TEXT PRIMARY KEY,
+            guild_id TEXT,
+            enabled_by TEXT,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+
+def _add_conversation_summaries(conn: sqlite3.Connection):
+    """v5: rolling summary per (user, channel), covering conversations up to last_conversation_id"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            user_id TEXT NOT NULL,
+            channel_id TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            last_conversation_id INTEGER NOT NULL,
+            turns INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (channel_id, user_id)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversation_summaries_updated_at
+        ON conversation_summaries (updated_at)
+    ''')
+
+# (version, migration) pairs applied in order; never edit a released entry
+MIGRATIONS: List[Tuple[int, Callable[[sqlite3.Connection], None]]] = [
+    (1, _create_conversations),
+    (2, _add_epoch_timestamps),
+    (3, _add_full_text_index),
+    (4, _add_monitored_channels),
+    (5, _add_conversation_summaries),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Bring the database up to the latest schema version and return it.
+
+    Must run outside a transaction: migrations that touch many rows commit
+    in batches so the database stays usable while they run.
+    """
+    version = get_schema_version(conn)
+    if version == 0 and not conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+        # Lets maintenance reclaim space with incremental vacuum; switching
+        # needs a VACUUM, which is instant while the database is still empty
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+    for target, migration in MIGRATIONS:
+        if target <= version:
+            continue
+        migration(conn)
+        conn.execute(f"PRAGMA user_version = {int(target)}")
+        version = target
+    return version
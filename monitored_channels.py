@@ -0,0 +1,83 @@
+import asyncio
+import time
+from typing import Iterator, Optional, Set
+
+from storage import StorageEngine
+
+class MonitoredChannels:
+    """Channels with auto-search enabled, persisted in the shared database.
+
+    Membership checks read an in-memory copy, so on_message never touches
+    the database. The copy is reloaded every `refresh_interval` seconds to
+    pick up channels toggled from other shard processes.
+    """
+
+    def __init__(self, storage: StorageEngine, refresh_interval: float = 30.0):
+        self.storage = storage
+        self.refresh_interval = refresh_interval
+        self._task: Optional[asyncio.Task] = None
+        self._channels: Set[int] = self.storage.submit_read(self._read).result()
+
+    @staticmethod
+    def _read(conn) -> Set[int]:
+        return {int(row[0]) for row in conn.execute("SELECT channel_id FROM monitored_channels")}
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._channels
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(set(self._channels))
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    def seed(self, channel_id: int):
+        """Enable a channel at startup (e.g. from CHANNEL_ID) without an event loop"""
+        self.storage.submit_write(lambda conn: conn.execute(
+            "INSERT OR IGNORE INTO monitored_channels (channel_id, created_at) VALUES (?, ?)",
+            (str(channel_id), int(time.time()))
+        )).result()
+        self._channels.add(channel_id)
+
+    async def enable(self, channel_id: int, guild_id: Optional[int] = None,
+                     user_id: Optional[int] = None):
+        """Turn on auto-search for a channel in every process"""
+        await self.storage.execute('''
+            INSERT OR IGNORE INTO monitored_channels (channel_id, guild_id, enabled_by, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (str(channel_id), str(guild_id) if guild_id else None,
+              str(user_id) if user_id else None, int(time.time())))
+        self._channels.add(channel_id)
+
+    async def disable(self, channel_id: int):
+        """Turn off auto-search for a channel in every process"""
+        await self.storage.execute(
+            "DELETE FROM monitored_channels WHERE channel_id = ?", (str(channel_id),)
+        )
+        self._channels.discard(channel_id)
+
+    async def refresh(self):
+        """Reload the set from the database"""
+        self._channels = await self.storage.run_read(self._read)
+
+    def start(self):
+        """Start the periodic reload"""
+        if self._task is None and self.refresh_interval > 0:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing monitored channels: {e}")
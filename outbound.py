@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Union
+
+import discord
+
+from chunker import EMBED_TOTAL_LIMIT, EMBEDS_PER_MESSAGE, MESSAGE_LIMIT, pack_embeds
+from metrics import ERRORS, OUTBOUND_WAIT_SECONDS, RATE_LIMITED, SEND_SECONDS
+from rate_limiter import TokenBucket
+
+class RateLimitCounter(logging.Handler):
+    """Count the 429s discord.py reports while it sleeps them out.
+
+    discord.py handles rate-limit headers internally and only surfaces 429s
+    through its `discord.http` logger, so that is where they are counted.
+    Each 429 logs "responded with 429", followed in the same step, without
+    yielding to the loop, by "Global rate limit has been hit" when it was a
+    global limit. A 429 is therefore counted once the logging task yields,
+    with the scope taken from whether the global record followed it.
+    """
+
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.count = 0
+        self._pending = 0
+
+    def emit(self, record: logging.LogRecord):
+        message = str(record.msg)
+        if 'responded with 429' in message:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is None or 'erroring instead' in message:
+                # No global record follows these
+                self._record('route')
+                return
+            self._pending += 1
+            loop.call_soon(self._settle)
+        elif 'Global rate limit' in message and self._pending:
+            self._pending -= 1
+            self._record('global')
+
+    def _settle(self):
+        while self._pending:
+            self._pending -= 1
+            self._record('route')
+
+    def _record(self, scope: str):
+        self.count += 1
+        RATE_LIMITED.inc(scope=scope)
+
+class _Job:
+    __slots__ = ('kind', 'target', 'content', 'embeds', 'extras', 'mergeable', 'future', 'enqueued')
+
+    def __init__(self, kind: str, target, content: Optional[str], embeds: Optional[List[discord.Embed]],
+                 extras: Dict, future: asyncio.Future, mergeable: bool = True):
+        self.kind = kind
+        self.target = target
+        self.content = content
+        self.embeds = embeds
+        self.extras = extras  # Files, views: anything that makes a send unmergeable
+        self.mergeable = mergeable and not extras
+        self.future = future
+        self.enqueued = time.monotonic()
+
+    def can_merge(self, other: "_Job") -> bool:
+        """Whether other can be folded into this reply as one API call"""
+        if self.kind != 'reply' or other.kind != 'reply' or other.target is not self.target:
+            return False
+        if not (self.mergeable and other.mergeable):
+            return False
+        if self.embeds or other.embeds:
+            # Embed replies merge only with other embed-only replies
+            embeds = (self.embeds or []) + (other.embeds or [])
+            return (not (self.content or other.content) and len(embeds) <= EMBEDS_PER_MESSAGE
+                    and sum(len(e) for e in embeds) <= EMBED_TOTAL_LIMIT)
+        return len(self.content) + len(other.content) + 2 <= MESSAGE_LIMIT
+
+    def merge(self, other: "_Job"):
+        if self.embeds or other.embeds:
+            self.embeds = (self.embeds or []) + (other.embeds or [])
+        else:
+            self.content = f"{self.content}\n\n{other.content}"
+
+class OutboundDispatcher:
+    """Per-channel queues for outgoing replies and edits.
+
+    Callers enqueue and get a future for the resulting message instead of
+    waiting on Discord. Each channel is drained by its own short-lived task,
+    paced by a local token bucket that mirrors Discord's per-channel limit so
+    bursts are spread out rather than answered with 429s. While a channel is
+    waiting, replies to the same message are merged into one send and
+    repeated edits of a message collapse into the latest one.
+    """
+
+    def __init__(self, rate_per_minute: float = 60, burst: float = 5):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self._queues: Dict[int, Deque[_Job]] = {}
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.sent = 0
+        self.merged = 0
+        self.coalesced_edits = 0
+        self.failed = 0
+        self.rate_limits = RateLimitCounter()
+        logging.getLogger('discord.http').addHandler(self.rate_limits)
+
+    def reply(self, message: discord.Message, content: Optional[str] = None,
+              embeds: Optional[List[discord.Embed]] = None, mergeable: bool = True,
+              **extras) -> asyncio.Future:
+        """Queue a reply to message; the future resolves to the sent message.
+
+        Pass mergeable=False for replies that will be edited later. Extra
+        keyword arguments (file, view, ...) are passed to Message.reply.
+        """
+        return self._enqueue(message.channel.id, _Job('reply', message, content, embeds, extras,
+                                                      self._new_future(), mergeable))
+
+    def reply_chunked(self, message: discord.Message, text: str, color: int = 0x0099ff) -> List[asyncio.Future]:
+        """Queue an answer in as few messages as possible, packing long ones into embeds"""
+        if len(text) <= MESSAGE_LIMIT:
+            return [self.reply(message, text)]
+        return [
+            self.reply(message, embeds=[discord.Embed(description=d, color=color) for d in descriptions])
+            for descriptions in pack_embeds(text)
+        ]
+
+    def edit(self, target: Union[discord.Message, asyncio.Future], content: str,
+             channel_id: int) -> asyncio.Future:
+        """Queue an edit of a sent message (or of a queued reply's future)"""
+        queue = self._queues.get(channel_id)
+        if queue:
+            for job in queue:
+                if job.kind == 'edit' and job.target is target:
+                    # Only the latest text matters; skip the superseded edit
+                    job.content = content
+                    self.coalesced_edits += 1
+                    return job.future
+        return self._enqueue(channel_id, _Job('edit', target, content, None, {}, self._new_future()))
+
+    def _new_future(self) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        # Fire-and-forget callers never read failures; they are logged in _send
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return future
+
+    def _enqueue(self, channel_id: int, job: _Job) -> asyncio.Future:
+        self._queues.setdefault(channel_id, deque()).append(job)
+        if channel_id not in self._workers:
+            self._workers[channel_id] = asyncio.create_task(self._run(channel_id))
+        return job.future
+
+    async def _run(self, channel_id: int):
+        queue = self._queues[channel_id]
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = TokenBucket(self.rate_per_minute, self.burst)
+        try:
+            while queue:
+                await bucket.acquire()
+                job = queue.popleft()
+                batch = [job]
+                while queue and job.can_merge(queue[0]):
+                    other = queue.popleft()
+                    job.merge(other)
+                    batch.append(other)
+                self.merged += len(batch) - 1
+                await self._send(job, batch)
+        finally:
+            del self._workers[channel_id]
+            if not queue:
+                del self._queues[channel_id]
+
+    async def _send(self, job: _Job, batch: List[_Job]):
+        try:
+            with SEND_SECONDS.time(kind=job.kind):
+                if job.kind == 'reply':
+                    kwargs = dict(job.extras)
+                    if job.embeds:
+                        kwargs['embeds'] = job.embeds
+                    result = await job.target.reply(job.content, **kwargs)
+                else:
+                    message = job.target
+                    if isinstance(message, asyncio.Future):
+                        message = await message
+                    result = await message.edit(content=job.content)
+        except Exception as e:
+            self.failed += 1
+            ERRORS.inc(component='outbound')
+            print(f"Error sending Discord {job.kind}: {e}")
+            for queued in batch:
+                if not queued.future.done():
+                    queued.future.set_exception(e)
+            return
+
+        self.sent += 1
+        now = time.monotonic()
+        for queued in batch:
+            OUTBOUND_WAIT_SECONDS.observe(now - queued.enqueued)
+            if not queued.future.done():
+                queued.future.set_result(result)
+
+    async def drain(self, timeout: Optional[float] = None):
+        """Wait until everything queued so far has been sent"""
+        workers = list(self._workers.values())
+        if workers:
+            await asyncio.wait(workers, timeout=timeout)
+
+    async def close(self, timeout: float = 5.0):
+        """Give queued sends a moment to go out, then drop the rest"""
+        await self.drain(timeout)
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self._queues.values():
+            for job in queue:
+                job.future.cancel()
+        self._queues.clear()
+        logging.getLogger('discord.http').removeHandler(self.rate_limits)
+
+    def get_stats(self) -> Dict:
+        """Return queue depth and send counters"""
+        return {
+            'queued': sum(len(queue) for queue in self._queues.values()),
+            'channels': len(self._workers),
+            'sent': self.sent,
+            'merged': self.merged,
+            'coalesced_edits': self.coalesced_edits,
+            'failed': self.failed,
+            'rate_limited': self.rate_limits.count,
+            'bucket_waits': sum(bucket.waits for bucket in self._buckets.values()),
+        }
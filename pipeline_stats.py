@@ -0,0 +1,39 @@
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+class PipelineStats:
+    """Per-mode model call counts and latencies for processed messages"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, Deque[Tuple[int, float]]] = {}
+        self.messages: Dict[str, int] = {}
+
+    def record(self, mode: str, model_calls: int, latency: float):
+        """Record one processed message"""
+        samples = self._samples.setdefault(mode, deque(maxlen=self.window))
+        samples.append((model_calls, latency))
+        self.messages[mode] = self.messages.get(mode, 0) + 1
+
+    @staticmethod
+    def _percentile(values, pct: float) -> float:
+        ordered = sorted(values)
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Dict]:
+        """Median/p95 model calls and latency per mode over the recent window"""
+        result = {}
+        for mode, samples in self._samples.items():
+            calls = [c for c, _ in samples]
+            latencies = [l for _, l in samples]
+            result[mode] = {
+                'messages': self.messages[mode],
+                'median_calls': self._percentile(calls, 50),
+                'mean_calls': sum(calls) / len(calls),
+                'p50_latency': self._percentile(latencies, 50),
+                'p95_latency': self._percentile(latencies, 95),
+            }
+        return result
@@ -0,0 +1,179 @@
+import math
+import re
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
+
+_WORD = re.compile(r'\w+')
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: ~4 ASCII characters per token, one per other character"""
+    ascii_chars = sum(1 for c in text if c < '\x80')
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+def trim_to_tokens(text: str, budget: int) -> str:
+    """Cut text to roughly `budget` tokens, preferring a word boundary"""
+    if budget <= 0:
+        return ""
+    if estimate_tokens(text) <= budget:
+        return text
+    # Binary search the longest prefix that fits
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text.rfind(' ', 0, low)
+    return text[:cut if cut > low // 2 else low].rstrip() + "..."
+
+def _terms(text: str) -> Set[str]:
+    """Casefolded words, plus character bigrams for scripts written without spaces"""
+    terms = set()
+    for word in _WORD.findall(text.casefold()):
+        if word.isascii():
+            if len(word) > 2:
+                terms.add(word)
+        else:
+            terms.update(word[i:i + 2] for i in range(len(word) - 1))
+    return terms
+
+class PromptBuilder:
+    """Assembles prompt sections under per-section token budgets and tracks prompt sizes"""
+
+    def __init__(self, context_budget: int = 400, search_budget: int = 2000,
+                 message_budget: int = 500, window: int = 1000,
+                 summary_budget: int = 300, summary_recent_turns: int = 2,
+                 relevant_budget: int = 300):
+        self.context_budget = context_budget
+        self.search_budget = search_budget
+        self.message_budget = message_budget
+        self.summary_budget = summary_budget
+        self.summary_recent_turns = summary_recent_turns
+        self.relevant_budget = relevant_budget
+        self._sizes: Dict[str, Deque[int]] = {}
+        self.window = window
+
+    def build_message(self, message: str) -> str:
+        """The user's message, capped at the message budget"""
+        return trim_to_tokens(message, self.message_budget)
+
+    def build_relevant(self, relevant: List[Dict], context: List[Dict]) -> str:
+        """Render earlier exchanges retrieved by similarity, best first, within their own budget"""
+        recent = {conv.get('message') for conv in context or []}
+        remaining = self.relevant_budget
+        lines: List[str] = []
+        for conv in relevant:
+            if remaining < 20:
+                break
+            if conv.get('message') in recent:
+                continue
+            text = f"User: {conv['message']}"
+            if conv.get('response'):
+                text += f"\nAssistant: {conv['response']}"
+            # No single exchange takes the whole section
+            text = trim_to_tokens(text, min(remaining, max(20, self.relevant_budget // 2)))
+            lines.append(text)
+            remaining -= estimate_tokens(text)
+        if not lines:
+            return ""
+        return "Relevant earlier exchanges:\n" + "\n".join(lines) + "\n"
+
+    def build_context(self, context: List[Dict], summary: Optional[Dict] = None,
+                      relevant: Optional[List[Dict]] = None) -> str:
+        """Render recent exchanges, newest first until the context budget is spent.
+
+        With a rolling `summary` of the conversation (as returned by
+        ConversationSummarizer.get), turns it already covers are dropped
+        except the last few, which stay verbatim; turns newer than the
+        summary are all kept, since it may lag behind under load.
+        `relevant` exchanges (older ones similar to the current message)
+        come before the recent turns.
+        """
+        header = ""
+        if summary and summary.get('summary'):
+            text = trim_to_tokens(summary['summary'], self.summary_budget)
+            header = f"Summary of the earlier conversation: {text}\n"
+            covered = summary.get('last_conversation_id') or 0
+            context = context or []
+            verbatim_from = len(context) - max(0, self.summary_recent_turns)
+            context = [conv for i, conv in enumerate(context)
+                       if i >= verbatim_from or conv.get('id', 0) > covered]
+        if relevant:
+            header += self.build_relevant(relevant, context)
+        if not context:
+            return header.rstrip("\n")
+
+        remaining = self.context_budget
+        lines: List[str] = []
+        for conv in reversed(context):
+            turn = []
+            if conv.get('message'):
+                turn.append(f"User: {conv['message']}")
+            if conv.get('response'):
+                turn.append(f"Assistant: {conv['response']}")
+            text = "\n".join(turn)
+            cost = estimate_tokens(text)
+            if cost > remaining:
+                # The newest turn is always kept, trimmed to fit
+                if not lines:
+                    lines.append(trim_to_tokens(text, remaining))
+                break
+            lines.append(text)
+            remaining -= cost
+
+        return header + "\n".join(reversed(lines))
+
+    def build_search_info(self, message: str, search_results: List[Dict]) -> str:
+        """Render search results, keeping the passages most relevant to the message"""
+        passages = []
+        for index, result in enumerate(search_results):
+            if not result.get('success'):
+                continue
+            wanted = _terms(message) | _terms(result['query'])
+            blocks = [b.strip() for b in re.split(r'\n\s*\n|\n(?=\s*[-*•\d])', result['results']) if b.strip()]
+            for position, block in enumerate(blocks):
+                overlap = len(_terms(block) & wanted)
+                # Earlier passages usually carry the summary; break ties towards them
+                score = overlap + 1.0 / (1 + position)
+                passages.append((score, index, position, block))
+
+        remaining = self.search_budget
+        chosen = []
+        for score, index, position, block in sorted(passages, key=lambda p: -p[0]):
+            cost = estimate_tokens(block)
+            if cost > remaining:
+                if remaining < 50:
+                    break
+                block = trim_to_tokens(block, remaining)
+                cost = estimate_tokens(block)
+            chosen.append((index, position, block))
+            remaining -= cost
+
+        # Present the kept passages grouped by query, in their original order
+        sections = []
+        for i, result in enumerate(search_results):
+            kept = [block for index, _, block in sorted(chosen) if index == i]
+            if kept:
+                body = "\n".join(kept)
+                sections.append(f"\nSearch Query {len(sections) + 1}: {result['query']}\nResults: {body}\n")
+        return "".join(sections)
+
+    def record(self, stage: str, prompt: str) -> int:
+        """Remember the size of a prompt sent for a pipeline stage"""
+        tokens = estimate_tokens(prompt)
+        self._sizes.setdefault(stage, deque(maxlen=self.window)).append(tokens)
+        return tokens
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Average, p95 and max estimated prompt tokens per stage"""
+        stats = {}
+        for stage, sizes in self._sizes.items():
+            ordered = sorted(sizes)
+            stats[stage] = {
+                'prompts': len(ordered),
+                'avg_tokens': sum(ordered) / len(ordered),
+                'p95_tokens': ordered[int(0.95 * (len(ordered) - 1))],
+                'max_tokens': ordered[-1],
+            }
+        return stats
@@ -0,0 +1,39 @@
+import asyncio
+import time
+from typing import Optional
+
+class TokenBucket:
+    """Async token bucket refilled continuously at a requests-per-minute rate"""
+
+    def __init__(self, rate_per_minute: float, capacity: float = 1.0):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waits = 0
+        # Made on the first acquire(), inside the running loop; on Python 3.8
+        # and 3.9 a lock built at import time would belong to another loop
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available right now"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        """Wait until a token is available, serving waiters in arrival order"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        
+        async with self._lock:
+            while not self.try_acquire():
+                self.waits += 1
+                await asyncio.sleep((1 - self.tokens) / self.rate)
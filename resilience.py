@@ -0,0 +1,245 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import aiohttp
+from google.api_core import exceptions as google_exceptions
+
+from metrics import BREAKER_REJECTIONS, HEDGES, RETRIES
+
+# Transient failures worth another attempt; bad requests and auth errors are not
+_RETRYABLE = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    aiohttp.ClientError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServerError,
+)
+
+def is_retryable(error: BaseException) -> bool:
+    return isinstance(error, _RETRYABLE)
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter, so retrying clients spread out"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """Stops calling an unhealthy API after repeated failures.
+
+    After `failure_threshold` consecutive transient failures the breaker
+    opens and calls fail immediately. Once `reset_timeout` has passed a
+    single probe call is let through: success closes the breaker, failure
+    opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead; the caller must then report how it went"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                BREAKER_REJECTIONS.inc()
+                return False
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                BREAKER_REJECTIONS.inc()
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def record_abandoned(self):
+        """The call was cancelled before it said anything about the API's health"""
+        self._probing = False
+
+class RetryBudget:
+    """Caps extra attempts at a fraction of regular calls.
+
+    Every call deposits `ratio` tokens (up to `cap`); each retry or hedge
+    spends one, so extra traffic stays proportional to real traffic even
+    when the API is failing across the board.
+    """
+
+    def __init__(self, ratio: float, cap: float = 10.0):
+        self.ratio = ratio
+        self.cap = cap
+        self.tokens = cap if ratio > 0 else 0.0
+
+    def deposit(self):
+        self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class LatencyTracker:
+    """Recent call durations per key, for percentile estimates"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, key: str, seconds: float):
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def count(self, key: str) -> int:
+        return len(self._samples.get(key, ()))
+
+    def quantile(self, key: str, q: float) -> Optional[float]:
+        samples = self._samples.get(key)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class ResilientCaller:
+    """Runs a model call with jittered retries, optional hedging and a circuit breaker.
+
+    Retries stop at the caller's deadline and when the retry budget is
+    spent. With hedging on, a call still running after the key's p95
+    latency gets a duplicate, and whichever finishes first wins.
+    """
+
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 4.0,
+                 retry_budget: float = 0.2, hedge: bool = False, hedge_budget: float = 0.05,
+                 hedge_quantile: float = 0.95, hedge_min_samples: int = 20,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = RetryBudget(retry_budget)
+        self.hedge = hedge
+        self.hedge_budget = RetryBudget(hedge_budget)
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        """How long to wait before sending a duplicate, or None to not hedge"""
+        if not self.hedge or self.latency.count(key) < self.hedge_min_samples:
+            return None
+        return self.latency.quantile(key, self.hedge_quantile)
+
+    async def call(self, key: str, fn: Callable[[float], Awaitable[Any]], timeout: float,
+                   deadline: Optional[float] = None, hedge: bool = True) -> Any:
+        """Await fn(attempt_timeout) until it succeeds, retrying transient failures.
+
+        `deadline` is a time.monotonic() value after which no attempt is
+        started and running ones are abandoned.
+        """
+        self.retry_budget.deposit()
+        self.hedge_budget.deposit()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError("Gemini API circuit breaker is open")
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                self.breaker.record_abandoned()
+                raise asyncio.TimeoutError("Deadline passed before the model call")
+            attempt_timeout = timeout if remaining is None else min(timeout, remaining)
+
+            started = time.monotonic()
+            try:
+                # Under a deadline the wait for a concurrency slot counts too
+                result = await self._attempt(key, fn, attempt_timeout, hedge,
+                                             bounded=remaining is not None)
+            except asyncio.CancelledError:
+                self.breaker.record_abandoned()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # The API answered, just not with something we can use
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                if not self.retry_budget.withdraw():
+                    raise
+                self.retries += 1
+                RETRIES.inc(stage=key)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            self.latency.observe(key, time.monotonic() - started)
+            return result
+
+    async def _attempt(self, key: str, fn: Callable[[float], Awaitable[Any]],
+                       timeout: float, hedge: bool, bounded: bool) -> Any:
+        def start(budget: float) -> asyncio.Future:
+            coro = fn(budget)
+            return asyncio.ensure_future(asyncio.wait_for(coro, budget) if bounded else coro)
+
+        primary = start(timeout)
+        tasks = {primary}
+        hedged = False
+        try:
+            delay = self.hedge_delay(key) if hedge else None
+            if delay is not None and delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.hedge_budget.withdraw():
+                    hedged = True
+                    self.hedges += 1
+                    tasks.add(start(timeout - delay))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if hedged:
+                            winner = 'primary' if task is primary else 'hedge'
+                            self.hedge_wins += winner == 'hedge'
+                            HEDGES.inc(stage=key, winner=winner)
+                        return task.result()
+                    error = task.exception()
+            if hedged:
+                HEDGES.inc(stage=key, winner='none')
+            raise error
+        finally:
+            # Whichever attempt lost is no longer needed
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+# Lower value runs first
+PRIORITY_MANUAL = 0
+PRIORITY_AUTO = 1
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+class JobShedError(Exception):
+    """Set on a job's future when it was dropped before running"""
+
+class _Job:
+    __slots__ = ('fn', 'future', 'key', 'priority', 'enqueued')
+
+    def __init__(self, fn: Callable[[], Awaitable[Any]], future: asyncio.Future,
+                 key: Hashable, priority: int):
+        self.fn = fn
+        self.future = future
+        self.key = key
+        self.priority = priority
+        self.enqueued = time.monotonic()
+
+class JobScheduler:
+    """Fixed worker pool fed from a bounded queue with per-key fairness.
+
+    Jobs are grouped by a fairness key (e.g. guild id) and served round-robin
+    across keys, so one busy guild cannot starve the others. Manual jobs
+    always run before auto jobs. Auto jobs that waited longer than
+    `stale_after` seconds are shed instead of run, and may be evicted to make
+    room for a manual job when the queue is full.
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 100, stale_after: float = 60.0):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.stale_after = stale_after
+        self._queues: Dict[int, "OrderedDict[Hashable, Deque[_Job]]"] = {
+            PRIORITY_MANUAL: OrderedDict(),
+            PRIORITY_AUTO: OrderedDict(),
+        }
+        self._size = 0
+        self._tasks: List[asyncio.Task] = []
+        # Made in start(), which runs inside the bot's loop; Python before 3.10
+        # ties a semaphore to whatever loop is current when it is constructed
+        self._ready: Optional[asyncio.Semaphore] = None
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self.completed = 0
+        self.failed = 0
+        self.shed = 0
+        self.rejected = 0
+
+    def start(self):
+        """Spawn the worker tasks"""
+        if self._tasks:
+            return
+        self._ready = asyncio.Semaphore(0)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers and fail anything still queued"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for queues in self._queues.values():
+            for jobs in queues.values():
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.set_exception(JobShedError("Scheduler stopped"))
+            queues.clear()
+        self._size = 0
+
+    def submit(self, key: Hashable, fn: Callable[[], Awaitable[Any]],
+               priority: int = PRIORITY_AUTO) -> asyncio.Future:
+        """Queue fn() and return a future for its result"""
+        if not self._tasks:
+            self.start()
+        if self._size >= self.max_queue and not (
+                priority == PRIORITY_MANUAL and self._evict_auto_job()):
+            self.rejected += 1
+            raise QueueFullError("The request queue is full")
+
+        job = _Job(fn, asyncio.get_running_loop().create_future(), key, priority)
+        self._queues[priority].setdefault(key, deque()).append(job)
+        self._size += 1
+        self._ready.release()
+        return job.future
+
+    def _evict_auto_job(self) -> bool:
+        """Shed the oldest queued auto job to make room; False if there is none"""
+        queues = self._queues[PRIORITY_AUTO]
+        oldest_key = None
+        for key, jobs in queues.items():
+            if oldest_key is None or jobs[0].enqueued < queues[oldest_key][0].enqueued:
+                oldest_key = key
+        if oldest_key is None:
+            return False
+        self._shed(self._pop(PRIORITY_AUTO, oldest_key))
+        return True
+
+    def _pop(self, priority: int, key: Hashable) -> _Job:
+        queues = self._queues[priority]
+        jobs = queues[key]
+        job = jobs.popleft()
+        del queues[key]
+        if jobs:
+            # Re-inserting moves the key to the back of the round-robin order
+            queues[key] = jobs
+        self._size -= 1
+        return job
+
+    def _next_job(self) -> Optional[_Job]:
+        for priority in (PRIORITY_MANUAL, PRIORITY_AUTO):
+            queues = self._queues[priority]
+            if queues:
+                return self._pop(priority, next(iter(queues)))
+        return None
+
+    def _shed(self, job: _Job):
+        self.shed += 1
+        if not job.future.done():
+            job.future.set_exception(JobShedError("Job waited too long in the queue"))
+
+    async def _worker(self):
+        while True:
+            await self._ready.acquire()
+            job = self._next_job()
+            if job is None or job.future.done():
+                continue  # Evicted or cancelled by the submitter
+
+            wait = time.monotonic() - job.enqueued
+            if job.priority == PRIORITY_AUTO and wait > self.stale_after:
+                self._shed(job)
+                continue
+            self._waits.append(wait)
+
+            try:
+                result = await job.fn()
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except Exception as e:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self.completed += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+
+    def get_stats(self) -> Dict:
+        """Return queue depth, wait times and job counters"""
+        waits = sorted(self._waits)
+        return {
+            'depth': self._size,
+            'depth_manual': sum(len(j) for j in self._queues[PRIORITY_MANUAL].values()),
+            'depth_auto': sum(len(j) for j in self._queues[PRIORITY_AUTO].values()),
+            'wait_avg': sum(waits) / len(waits) if waits else 0.0,
+            'wait_p95': waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+            'completed': self.completed,
+            'failed': self.failed,
+            'shed': self.shed,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,123 @@
+import sqlite3
+import time
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from storage import StorageEngine
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so trivially different phrasings share one cache key"""
+    query = unicodedata.normalize('NFKC', query).casefold()
+    query = re.sub(r'[^\w\s]', ' ', query)  # Drop punctuation
+    return ' '.join(query.split())
+
+class SearchCache:
+    """In-memory LRU with TTL for search results, backed by a SQLite table.
+
+    Expired rows are kept for another `stale_seconds` so get_stale() can
+    still answer while the model is unavailable.
+    """
+
+    def __init__(self, db_path: str = "conversation_memory.db",
+                 max_entries: int = 512, ttl_seconds: int = 3600,
+                 storage: Optional[StorageEngine] = None, stale_seconds: int = 86400):
+        self.db_path = db_path
+        self.storage = storage or StorageEngine(db_path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.init_database()
+
+    def init_database(self):
+        """Create the search_cache table next to conversations"""
+        self.storage.submit_write(self._create_tables).result()
+
+    def _create_tables(self, conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS search_cache (
+                query_key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                results TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+
+    def _remember(self, key: str, results: str, created_at: float):
+        self._entries[key] = (results, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _is_fresh(self, created_at: float) -> bool:
+        return time.time() - created_at < self.ttl_seconds
+
+    async def get(self, query: str) -> Optional[str]:
+        """Return cached results for a query, or None on a miss"""
+        key = normalize_query(query)
+        entry = self._entries.get(key)
+        
+        if entry is None:
+            entry = await self.storage.fetchone('''
+                SELECT results, created_at FROM search_cache WHERE query_key = ?
+            ''', (key,))
+            if entry is not None and self._is_fresh(entry[1]):
+                self._remember(key, *entry)
+        
+        if entry is not None and self._is_fresh(entry[1]):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        
+        if key in self._entries:
+            del self._entries[key]
+            self.evictions += 1
+        self.misses += 1
+        return None
+
+    async def get_stale(self, query: str) -> Optional[str]:
+        """Return results for a query even if they have expired, or None"""
+        key = normalize_query(query)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = await self.storage.fetchone('''
+                SELECT results, created_at FROM search_cache WHERE query_key = ?
+            ''', (key,))
+        if entry is None or time.time() - entry[1] >= self.ttl_seconds + self.stale_seconds:
+            return None
+        return entry[0]
+
+    async def set(self, query: str, results: str):
+        """Store results in memory and persist them to SQLite"""
+        key = normalize_query(query)
+        created_at = time.time()
+        self._remember(key, results, created_at)
+        
+        await self.storage.execute('''
+            INSERT OR REPLACE INTO search_cache (query_key, query, results, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (key, query, results, created_at))
+
+    async def purge_expired(self) -> int:
+        """Delete persisted entries past their TTL and stale window and return how many were removed"""
+        cutoff = time.time() - self.ttl_seconds - self.stale_seconds
+        return await self.storage.run_write(
+            lambda conn: conn.execute(
+                "DELETE FROM search_cache WHERE created_at < ?", (cutoff,)
+            ).rowcount
+        )
+
+    def get_stats(self) -> Dict:
+        """Return hit/miss/eviction counters"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+        }
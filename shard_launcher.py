@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Gemini Discord Search Bot Shard Launcher
+Runs the bot's shards across several worker processes that share one database
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+
+import discord
+
+from config import Config
+from migrations import migrate
+from storage import create_storage
+
+logger = logging.getLogger(__name__)
+
+# Discord accepts one IDENTIFY per 5 seconds unless the bot has a higher max_concurrency
+IDENTIFY_INTERVAL = 5.0
+# Wait before restarting a crashed process, doubled while it keeps crashing on startup
+RESTART_DELAY = 10.0
+MAX_RESTART_DELAY = 300.0
+# A process that ran this long is considered healthy again
+HEALTHY_AFTER = 60.0
+# Exit code for failures a restart cannot fix, such as an invalid token
+EXIT_FATAL = 2
+
+def fetch_shard_count(token: str) -> int:
+    """Ask Discord for the recommended number of shards"""
+    async def fetch():
+        http = discord.http.HTTPClient(asyncio.get_running_loop())
+        try:
+            await http.static_login(token)
+            shards, _ = await http.get_bot_gateway()
+            return shards
+        finally:
+            await http.close()
+
+    return asyncio.run(fetch())
+
+def assign_shards(shard_count: int, processes: int) -> List[List[int]]:
+    """Spread shard ids round-robin over processes"""
+    processes = max(1, min(processes, shard_count))
+    return [list(range(index, shard_count, processes)) for index in range(processes)]
+
+def run_shard_process(shard_ids: List[int], shard_count: int, process_index: int):
+    """Entry point of a worker process: run one bot covering shard_ids"""
+    setup_logging()
+    # Let the bot shut down cleanly (flushing queued writes) when the launcher stops it
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    from discord_bot import setup_bot
+
+    bot = setup_bot(shard_ids=shard_ids, shard_count=shard_count, process_index=process_index)
+    logger.info(f"Process {process_index} starting shards {shard_ids} of {shard_count}")
+    try:
+        bot.run(Config.DISCORD_TOKEN, log_handler=None)
+    except discord.LoginFailure as e:
+        logger.error(f"Login failed: {e}")
+        sys.exit(EXIT_FATAL)
+
+class ShardSupervisor:
+    """Start one worker process per shard group and restart any that crash"""
+
+    def __init__(self, assignments: List[List[int]], shard_count: int):
+        self.assignments = assignments
+        self.shard_count = shard_count
+        self.context = multiprocessing.get_context('spawn')
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.started: Dict[int, float] = {}
+        self.delays: Dict[int, float] = {}
+        self.restart_at: Dict[int, float] = {}
+        self.stopping = False
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def _sleep(self, seconds: float):
+        """Sleep, waking early once a stop has been requested"""
+        deadline = time.monotonic() + seconds
+        while not self.stopping and time.monotonic() < deadline:
+            time.sleep(min(0.5, deadline - time.monotonic()))
+
+    def _start(self, index: int):
+        process = self.context.Process(
+            target=run_shard_process,
+            args=(self.assignments[index], self.shard_count, index),
+            name=f"shard-process-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+        self.started[index] = time.monotonic()
+
+    def _check(self, index: int, process: multiprocessing.Process) -> Optional[int]:
+        """Schedule a restart for a process that exited; return its exit code if fatal"""
+        if process.is_alive() or index in self.restart_at:
+            return None
+        code = process.exitcode
+        if code == EXIT_FATAL:
+            return code
+
+        delay = self.delays.get(index, RESTART_DELAY)
+        if time.monotonic() - self.started[index] >= HEALTHY_AFTER:
+            delay = RESTART_DELAY
+        logger.warning(f"Process {index} exited with code {code}; restarting in {delay:.0f}s")
+        self.restart_at[index] = time.monotonic() + delay
+        self.delays[index] = min(delay * 2, MAX_RESTART_DELAY)
+        return None
+
+    def run(self) -> int:
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGTERM, self._request_stop)
+
+        # Stagger startup so the processes don't exceed the IDENTIFY limit together
+        for index, shard_ids in enumerate(self.assignments):
+            if self.stopping:
+                break
+            self._start(index)
+            self._sleep(len(shard_ids) * IDENTIFY_INTERVAL)
+
+        exit_code = 0
+        while not self.stopping:
+            for index, process in list(self.processes.items()):
+                fatal = self._check(index, process)
+                if fatal is not None:
+                    logger.error(f"Process {index} failed permanently; shutting down")
+                    exit_code = fatal
+                    self.stopping = True
+                    break
+                if index in self.restart_at and time.monotonic() >= self.restart_at[index]:
+                    del self.restart_at[index]
+                    self._start(index)
+            self._sleep(1.0)
+
+        self.stop()
+        return exit_code
+
+    def stop(self, timeout: float = 30.0):
+        """Ask every process to shut down, killing those that don't in time"""
+        logger.info("Stopping shard processes...")
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self.processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+def setup_logging():
+    """Log to bot.log and stdout; also run in each worker process, since spawn starts them fresh"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('bot.log'),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
+def main():
+    """Main function to start the sharded bot"""
+    setup_logging()
+    try:
+        Config.validate()
+    except ValueError as e:
+        logger.error(f"Configuration error: {e}")
+        sys.exit(1)
+
+    shard_count = Config.SHARD_COUNT or fetch_shard_count(Config.DISCORD_TOKEN)
+    assignments = assign_shards(shard_count, Config.SHARD_PROCESSES)
+    logger.info(f"Running {shard_count} shards in {len(assignments)} processes")
+
+    # Apply schema migrations once, before several processes open the database
+    storage = create_storage(Config.DATABASE_URL or Config.DATABASE_PATH)
+    try:
+        storage.submit_write(migrate, transactional=False).result()
+    finally:
+        storage.close()
+
+    # The Gemini quota is per API key, so each process gets its share
+    if Config.GEMINI_RPM > 0:
+        os.environ['GEMINI_RPM'] = str(Config.GEMINI_RPM / len(assignments))
+
+    sys.exit(ShardSupervisor(assignments, shard_count).run())
+
+if __name__ == "__main__":
+    main()
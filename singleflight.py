@@ -0,0 +1,60 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar('T')
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight task"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def is_in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn() for key, or wait for the identical call already running.
+
+        The shared task is shielded, so a caller that gets cancelled (e.g. by
+        its own deadline) does not cancel the work for everyone else. Once
+        every caller has given up, the task itself is cancelled.
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    self.abandoned += 1
+                    task.cancel()
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Nobody may be awaiting any more; don't let the error go unretrieved
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict:
+        """Return call/coalesced counters"""
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'abandoned': self.abandoned,
+            'in_flight': len(self._inflight),
+        }
@@ -0,0 +1,239 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+class StorageEngine:
+    """Long-lived SQLite connections in WAL mode, serviced off the event loop.
+
+    All writes go through one dedicated writer thread that drains its queue
+    and commits whatever it collected in a single transaction (group commit).
+    Reads run on a small pool of reader connections, which WAL lets proceed
+    alongside the writer.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_path: str = "conversation_memory.db", readers: int = 2,
+                 max_batch: int = 256, busy_timeout_ms: int = 5000):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.busy_timeout_ms = busy_timeout_ms
+        self.commits = 0
+        self.writes = 0
+
+        self._writes: "queue.Queue" = queue.Queue()
+        self._reader_conns: List[sqlite3.Connection] = []
+        self._reader_local = threading.local()
+        self._readers = ThreadPoolExecutor(
+            max_workers=max(1, readers),
+            thread_name_prefix="storage-reader"
+        )
+
+        # Open the writer connection first so WAL mode is set before readers attach
+        self._writer_conn = self._connect()
+        self._writer_conn.execute("PRAGMA journal_mode=WAL")
+        self._writer = threading.Thread(target=self._write_loop, name="storage-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: the writer thread manages transactions explicitly
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._reader_local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._reader_local.conn = conn
+            self._reader_conns.append(conn)
+        return conn
+
+    def _write_loop(self):
+        conn = self._writer_conn
+        while True:
+            job = self._writes.get()
+            if job is self._STOP:
+                break
+
+            batch = [job]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if job is self._STOP:
+                    stop = True
+                    break
+                batch.append(job)
+
+            try:
+                self._run_batch(conn, batch)
+            except Exception as e:
+                # Never let the writer thread die with callers waiting on it
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            if stop:
+                break
+
+        conn.close()
+
+    def _run_batch(self, conn: sqlite3.Connection, batch: List[Tuple[Callable, Future, bool]]):
+        pending: List[Tuple[Future, Any]] = []
+        begin_error: Optional[Exception] = None
+
+        def commit():
+            if not pending:
+                return
+            try:
+                conn.execute("COMMIT")
+                self.commits += 1
+                for future, result in pending:
+                    future.set_result(result)
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                for future, _ in pending:
+                    future.set_exception(e)
+            pending.clear()
+
+        for fn, future, transactional in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            if not transactional:
+                # Jobs that manage their own transactions run between groups
+                commit()
+                try:
+                    future.set_result(fn(conn))
+                except Exception as e:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    future.set_exception(e)
+                continue
+
+            if begin_error is not None:
+                future.set_exception(begin_error)
+                continue
+            if not conn.in_transaction:
+                # Take the write lock up front: a deferred transaction that has to
+                # upgrade fails at once when another process holds it, while
+                # IMMEDIATE waits out busy_timeout
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                except sqlite3.Error as e:
+                    # Still locked after busy_timeout (e.g. another process is
+                    # running maintenance): fail the rest of this group rather
+                    # than wait out the timeout once per job
+                    begin_error = e
+                    future.set_exception(e)
+                    continue
+            # Each job gets a savepoint, so a job that fails partway through
+            # undoes all of its own writes while the rest of the group carries on
+            conn.execute("SAVEPOINT job")
+            try:
+                result = fn(conn)
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                else:
+                    # SQLite rolled back the whole transaction (e.g. disk full)
+                    for earlier, _ in pending:
+                        earlier.set_exception(e)
+                    pending.clear()
+                future.set_exception(e)
+                continue
+            conn.execute("RELEASE job")
+            pending.append((future, result))
+            self.writes += 1
+
+        commit()
+
+    def submit_write(self, fn: Callable[[sqlite3.Connection], Any],
+                     transactional: bool = True) -> Future:
+        """Queue fn(conn) on the writer thread; resolves after its group commits"""
+        future: Future = Future()
+        self._writes.put((fn, future, transactional))
+        return future
+
+    def submit_read(self, fn: Callable[[sqlite3.Connection], Any]) -> Future:
+        """Run fn(conn) on a reader connection"""
+        return self._readers.submit(lambda: fn(self._reader()))
+
+    async def execute(self, sql: str, params: Iterable = ()) -> int:
+        """Execute a write statement and return the last inserted row id"""
+        return await asyncio.wrap_future(
+            self.submit_write(lambda conn: conn.execute(sql, tuple(params)).lastrowid)
+        )
+
+    async def executemany(self, sql: str, seq_of_params: Iterable[Iterable]) -> int:
+        """Execute a write statement for each parameter set and return the row count"""
+        rows = [tuple(p) for p in seq_of_params]
+        return await asyncio.wrap_future(
+            self.submit_write(lambda conn: conn.executemany(sql, rows).rowcount)
+        )
+
+    async def fetchall(self, sql: str, params: Iterable = ()) -> List[tuple]:
+        """Run a query and return every row"""
+        return await asyncio.wrap_future(
+            self.submit_read(lambda conn: conn.execute(sql, tuple(params)).fetchall())
+        )
+
+    async def fetchone(self, sql: str, params: Iterable = ()) -> Optional[tuple]:
+        """Run a query and return the first row"""
+        return await asyncio.wrap_future(
+            self.submit_read(lambda conn: conn.execute(sql, tuple(params)).fetchone())
+        )
+
+    async def run_write(self, fn: Callable[[sqlite3.Connection], Any],
+                        transactional: bool = True) -> Any:
+        """Run an arbitrary function with the writer connection"""
+        return await asyncio.wrap_future(self.submit_write(fn, transactional))
+
+    async def run_read(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run an arbitrary function with a reader connection"""
+        return await asyncio.wrap_future(self.submit_read(fn))
+
+    def close(self):
+        """Flush queued writes and close every connection"""
+        if self._writer.is_alive():
+            self._writes.put(self._STOP)
+            self._writer.join()
+        # Readers are closed even if the writer is already gone
+        self._readers.shutdown(wait=True)
+        for conn in self._reader_conns:
+            conn.close()
+        self._reader_conns.clear()
+
+# URL scheme -> factory taking the rest of the URL; register others with register_backend
+BACKENDS: Dict[str, Callable[[str], StorageEngine]] = {
+    'sqlite': StorageEngine,
+}
+
+def register_backend(scheme: str, factory: Callable[[str], StorageEngine]):
+    """Make create_storage() open `scheme://...` URLs with factory.
+
+    A backend must offer StorageEngine's interface (submit_write, submit_read
+    and the async helpers built on them) and accept the SQL the bot issues.
+    """
+    BACKENDS[scheme] = factory
+
+def create_storage(url: str) -> StorageEngine:
+    """Open the storage backend for a URL such as sqlite:///data/bot.db; bare paths mean SQLite"""
+    scheme, sep, location = url.partition('://')
+    if not sep:
+        return StorageEngine(url)
+    factory = BACKENDS.get(scheme)
+    if factory is None:
+        raise ValueError(f"Unsupported storage backend: {scheme}")
+    # sqlite:///relative.db and sqlite:////absolute/path.db, as in SQLAlchemy
+    return factory(location[1:] if location.startswith('/') else location)
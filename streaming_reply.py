@@ -0,0 +1,70 @@
+import asyncio
+import time
+from typing import List, Optional
+
+import discord
+
+from chunker import MESSAGE_LIMIT, MarkdownChunker
+from outbound import OutboundDispatcher
+
+class StreamingReply:
+    """Reply to a message and progressively edit the reply as the answer streams in.
+
+    Edits are throttled to one per `edit_interval` seconds to stay inside
+    Discord's per-channel edit rate limit. Text past `limit` characters is
+    frozen in place and continues in a follow-up reply. Sends go through the
+    outbound dispatcher, so feeding text never waits on Discord.
+    """
+
+    def __init__(self, message: discord.Message, outbound: OutboundDispatcher,
+                 edit_interval: float = 1.5, limit: int = MESSAGE_LIMIT):
+        self.message = message
+        self.outbound = outbound
+        self.edit_interval = edit_interval
+        self.limit = limit
+        self.sent: List[asyncio.Future] = []  # Futures of the replies, in order
+        self.text = ''
+        self._current = ''  # Text belonging to the latest reply
+        self._shown = ''  # What the latest reply currently displays
+        self._active: Optional[asyncio.Future] = None
+        self._last_flush = 0.0
+
+    async def feed(self, text: str):
+        """Append streamed text, editing the reply if the throttle allows"""
+        self.text += text
+        self._current += text
+        if time.monotonic() - self._last_flush >= self.edit_interval:
+            await self.flush()
+
+    async def flush(self):
+        """Push buffered text to Discord now"""
+        while len(self._current) > self.limit:
+            chunker = MarkdownChunker(self._current)
+            self._show(chunker.take(self.limit))
+            # Freeze the full message and start a new one with the remainder
+            self._active = None
+            self._shown = ''
+            self._current = chunker.rest()
+
+        if self._current.strip() and self._current != self._shown:
+            self._show(self._current)
+        self._last_flush = time.monotonic()
+
+    async def finish(self, final_text: Optional[str] = None):
+        """Flush everything, making sure the reply ends up showing final_text"""
+        if final_text is not None and final_text != self.text:
+            if final_text.startswith(self.text):
+                remainder = final_text[len(self.text):]
+                self.text += remainder
+                self._current += remainder
+            elif not self.sent:
+                self.text = self._current = final_text
+        await self.flush()
+
+    def _show(self, content: str):
+        if self._active is None:
+            self._active = self.outbound.reply(self.message, content, mergeable=False)
+            self.sent.append(self._active)
+        else:
+            self.outbound.edit(self._active, content, self.message.channel.id)
+        self._shown = content
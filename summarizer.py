@@ -0,0 +1,198 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from gemini_client import GeminiClient
+from metrics import ERRORS
+from prompt_builder import estimate_tokens, trim_to_tokens
+from storage import StorageEngine
+
+Key = Tuple[str, str]
+
+class ConversationSummarizer:
+    """Rolling summary per (user, channel), folded forward in the background after each exchange.
+
+    Prompts then carry the summary plus the last few raw turns instead of
+    the whole recent history, so their size stays fixed as conversations
+    grow. Updates run off the request path, one task per conversation;
+    exchanges that arrive while an update is running are picked up by a
+    follow-up pass, and updates are skipped while the model is saturated
+    (the unsummarized turns are simply included next time).
+    """
+
+    def __init__(self, storage: StorageEngine, client: GeminiClient,
+                 summary_tokens: int = 300, batch_size: int = 20,
+                 concurrency: int = 1, cache_size: int = 4096):
+        self.storage = storage
+        self.client = client
+        self.summary_tokens = summary_tokens
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Key, Dict]" = OrderedDict()
+        self._tasks: Dict[Key, asyncio.Task] = {}
+        self._dirty: set = set()
+        self.updates = 0
+        self.skipped = 0
+        # Deferred to the first summary so that, on Python 3.8/3.9, the
+        # semaphore is not bound to a loop other than the one running the bot
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def _remember(self, key: Key, summary: Dict):
+        self._cache[key] = summary
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def get(self, user_id: str, channel_id: str,
+                  max_age: Optional[float] = None) -> Optional[Dict]:
+        """Return the current summary for a conversation, if one exists.
+
+        The result has the summary text, `last_conversation_id` (the newest
+        exchange it covers) and `updated_at`. Summaries last updated more
+        than `max_age` seconds ago are ignored.
+        """
+        key = (user_id, channel_id)
+        summary = self._cache.get(key)
+        if summary is None:
+            row = await self.storage.fetchone('''
+                SELECT summary, last_conversation_id, updated_at
+                FROM conversation_summaries
+                WHERE channel_id = ? AND user_id = ?
+            ''', (channel_id, user_id))
+            if row is None:
+                return None
+            summary = {'summary': row[0], 'last_conversation_id': row[1], 'updated_at': row[2]}
+        self._remember(key, summary)
+        if max_age is not None and summary['updated_at'] < time.time() - max_age:
+            return None
+        return dict(summary)
+
+    def schedule(self, user_id: str, channel_id: str):
+        """Fold the latest exchanges into the summary, in the background"""
+        key = (user_id, channel_id)
+        if key in self._tasks:
+            # Picked up when the running update finishes
+            self._dirty.add(key)
+            return
+        self._tasks[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key: Key):
+        try:
+            while True:
+                self._dirty.discard(key)
+                async with self._get_semaphore():
+                    await self.update(*key)
+                if key not in self._dirty:
+                    break
+        except Exception as e:
+            ERRORS.inc(component='summarize')
+            print(f"Error updating conversation summary: {e}")
+        finally:
+            del self._tasks[key]
+
+    async def update(self, user_id: str, channel_id: str) -> bool:
+        """Fold unsummarized exchanges into the summary; return whether it changed"""
+        if self.client.load() >= 1:
+            # Answers come first; these turns are folded in on a later update
+            self.skipped += 1
+            return False
+
+        row = await self.storage.fetchone('''
+            SELECT summary, last_conversation_id, turns
+            FROM conversation_summaries
+            WHERE channel_id = ? AND user_id = ?
+        ''', (channel_id, user_id))
+        summary, last_id, turns = row or ("", 0, 0)
+
+        # Newest first, so a long backlog is bounded to its most recent part
+        rows = await self.storage.fetchall('''
+            SELECT id, message, response
+            FROM conversations
+            WHERE channel_id = ? AND user_id = ? AND id > ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (channel_id, user_id, last_id, self.batch_size))
+        if not rows:
+            return False
+        rows.reverse()
+
+        exchanges = []
+        for _, message, response in rows:
+            exchanges.append(f"User: {trim_to_tokens(message, 200)}")
+            if response:
+                exchanges.append(f"Assistant: {trim_to_tokens(response, 300)}")
+        exchanges_text = "\n".join(exchanges)
+        words = max(20, self.summary_tokens * 3 // 4)
+
+        prompt = f"""
+        Update the running summary of a conversation between a user and an assistant.
+
+        Keep facts, names, preferences, decisions, open questions and the topics that later messages may refer back to. Drop greetings and small talk. Write plain prose of at most {words} words.
+
+        Current summary:
+        {summary or "(none yet)"}
+
+        New exchanges:
+        {exchanges_text}
+
+        Return only the updated summary.
+        """
+        response = await self.client.generate(prompt, stage='summarize')
+        updated = (response.text or "").strip()
+        if not updated:
+            return False
+        if estimate_tokens(updated) > self.summary_tokens:
+            updated = trim_to_tokens(updated, self.summary_tokens)
+
+        # Another process may have folded in newer turns meanwhile; keep whichever covers more
+        now = int(time.time())
+        await self.storage.execute('''
+            INSERT INTO conversation_summaries
+                (user_id, channel_id, summary, last_conversation_id, turns, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (channel_id, user_id) DO UPDATE SET
+                summary = excluded.summary,
+                last_conversation_id = excluded.last_conversation_id,
+                turns = excluded.turns,
+                updated_at = excluded.updated_at
+            WHERE excluded.last_conversation_id > conversation_summaries.last_conversation_id
+        ''', (user_id, channel_id, updated, rows[-1][0], turns + len(rows), now))
+        self._remember((user_id, channel_id), {
+            'summary': updated,
+            'last_conversation_id': rows[-1][0],
+            'updated_at': now
+        })
+        self.updates += 1
+        return True
+
+    async def purge_older_than(self, days: int) -> int:
+        """Delete summaries of conversations idle for more than `days`"""
+        cutoff = int(time.time()) - days * 86400
+        self._cache.clear()
+        return await self.storage.run_write(
+            lambda conn: conn.execute(
+                "DELETE FROM conversation_summaries WHERE updated_at < ?", (cutoff,)
+            ).rowcount
+        )
+
+    async def stop(self):
+        """Cancel pending updates; their turns are summarized after the next exchange"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict:
+        """Return update counters"""
+        return {
+            'updates': self.updates,
+            'skipped': self.skipped,
+            'pending': len(self._tasks),
+        }
@@ -0,0 +1,223 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Optional: relevance retrieval is disabled without it
+    np = None
+
+_WORD = re.compile(r'\w+')
+
+def available() -> bool:
+    return np is not None
+
+def _features(text: str) -> List[str]:
+    """Word unigrams plus character trigrams, so inflections and CJK text still overlap"""
+    features = []
+    for word in _WORD.findall(unicodedata.normalize('NFKC', text).casefold()):
+        if len(word) > 2 or not word.isascii():
+            features.append('w:' + word)
+        padded = f" {word} "
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+def conversation_text(message: str, response: Optional[str] = None,
+                      search_query: Optional[str] = None) -> str:
+    """What gets indexed for one exchange: the question matters most, the answer's opening helps"""
+    parts = [message or "", search_query or "", (response or "")[:500]]
+    return " ".join(part for part in parts if part)
+
+class VectorIndex:
+    """Hashed n-gram vectors of past exchanges in memory-mapped arrays, for top-k cosine lookup.
+
+    Each exchange becomes an L2-normalised `dim`-wide vector (feature
+    hashing, so there is no vocabulary to maintain). Vectors, conversation
+    ids and their channel/user ids live in flat files under `path` that
+    grow by doubling; rows are appended as conversations are added. The
+    row count is saved in meta.json on flush; rows lost in a crash, or
+    recorded with mark_missing() after a failed add, are re-indexed from
+    the database on the next start.
+    """
+
+    _FIELDS = (('vectors', 'float32'), ('ids', 'int64'), ('channels', 'int64'), ('users', 'int64'))
+
+    def __init__(self, path: str, dim: int = 256, initial_capacity: int = 1024,
+                 flush_every: int = 100):
+        if np is None:
+            raise RuntimeError("VectorIndex requires numpy")
+        self.path = path
+        self.dim = dim
+        self.flush_every = flush_every
+        self.count = 0
+        self.capacity = 0
+        self._unflushed = 0
+        # Lowest conversation id that failed to be indexed, if any
+        self.resume_from: Optional[int] = None
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        meta = self._read_meta()
+        if meta and meta.get('dim') == dim:
+            self.count = meta['count']
+            self.resume_from = meta.get('resume_from')
+        else:
+            self.count = 0  # New index, or vectors of another width that can't be reused
+        self._open(max(initial_capacity, self.count))
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.path, 'meta.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _open(self, capacity: int):
+        """Map every array with room for `capacity` rows, growing the files as needed"""
+        for name, dtype in self._FIELDS:
+            shape = (capacity, self.dim) if name == 'vectors' else (capacity,)
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            with open(self._file(name), 'ab') as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            setattr(self, name, np.memmap(self._file(name), dtype=dtype, mode='r+', shape=shape))
+        self.capacity = capacity
+
+    def _grow(self, needed: int):
+        if needed <= self.capacity:
+            return
+        self.flush_arrays()
+        self._open(max(needed, self.capacity * 2))
+
+    def vectorize(self, text: str) -> "np.ndarray":
+        """L2-normalised hashed feature vector for text"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        features = _features(text)
+        if not features:
+            return vector
+        hashes = np.fromiter((zlib.crc32(f.encode('utf-8')) for f in features),
+                             dtype=np.uint64, count=len(features))
+        # The low bits pick the slot, the top bit the sign, so collisions tend to cancel
+        signs = np.where(hashes & (1 << 31), 1.0, -1.0).astype(np.float32)
+        np.add.at(vector, (hashes % self.dim).astype(np.intp), signs)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add(self, conversation_id: int, user_id: str, channel_id: str, text: str):
+        """Index one exchange"""
+        self.add_many([(conversation_id, user_id, channel_id, text)])
+
+    def add_many(self, rows: Sequence[Tuple[int, str, str, str]]):
+        """Index exchanges given as (conversation_id, user_id, channel_id, text)"""
+        if not rows:
+            return
+        # Hashing is the slow part and needs no lock
+        vectors = np.stack([self.vectorize(text) for _, _, _, text in rows])
+        with self._lock:
+            self._grow(self.count + len(rows))
+            end = self.count + len(rows)
+            self.vectors[self.count:end] = vectors
+            self.ids[self.count:end] = [int(row[0]) for row in rows]
+            self.users[self.count:end] = [int(row[1]) for row in rows]
+            self.channels[self.count:end] = [int(row[2]) for row in rows]
+            self.count = end
+            self._unflushed += len(rows)
+            if self._unflushed >= self.flush_every:
+                self._flush()
+
+    def last_id(self) -> int:
+        """Conversation id after which the database must be re-read to catch up"""
+        with self._lock:
+            # Concurrent adds can land slightly out of id order
+            last = int(self.ids[:self.count].max()) if self.count else 0
+            if self.resume_from is not None:
+                last = min(last, self.resume_from - 1)
+            return last
+
+    def indexed_after(self, conversation_id: int) -> Set[int]:
+        """Ids already indexed above conversation_id, so catching up doesn't add them twice"""
+        with self._lock:
+            ids = self.ids[:self.count]
+            return {int(i) for i in ids[ids > conversation_id]}
+
+    def mark_missing(self, conversation_id: int):
+        """Remember that a conversation could not be indexed, so the next start re-reads it"""
+        with self._lock:
+            if self.resume_from is None or conversation_id < self.resume_from:
+                self.resume_from = conversation_id
+            self._flush()
+
+    def clear_missing(self, through_id: int):
+        """Forget failed adds up to through_id once they have been re-indexed"""
+        with self._lock:
+            if self.resume_from is not None and self.resume_from <= through_id:
+                self.resume_from = None
+                self._flush()
+
+    def search(self, text: str, channel_id: str, user_id: Optional[str] = None,
+               k: int = 3, min_score: float = 0.0,
+               exclude_ids: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """Top-k (conversation_id, cosine similarity) in a channel, optionally for one user"""
+        query = self.vectorize(text)
+        if k <= 0 or not query.any():
+            return []
+        with self._lock:
+            count = self.count
+            mask = self.channels[:count] == int(channel_id)
+            if user_id is not None:
+                mask &= self.users[:count] == int(user_id)
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                return []
+            scores = self.vectors[rows] @ query
+            ids = self.ids[rows]
+
+        excluded = set(exclude_ids)
+        wanted = min(len(scores), k + len(excluded))
+        top = np.argpartition(-scores, wanted - 1)[:wanted]
+        results = []
+        for i in top[np.argsort(-scores[top])]:
+            if scores[i] < min_score:
+                break
+            if int(ids[i]) not in excluded:
+                results.append((int(ids[i]), float(scores[i])))
+            if len(results) == k:
+                break
+        return results
+
+    def prune(self, min_id: int) -> int:
+        """Drop rows for conversations older than min_id (removed by retention); return how many"""
+        with self._lock:
+            keep = np.flatnonzero(self.ids[:self.count] >= min_id)
+            removed = self.count - len(keep)
+            if removed:
+                for name, _ in self._FIELDS:
+                    array = getattr(self, name)
+                    array[:len(keep)] = array[keep]
+                self.count = len(keep)
+                self._flush()
+            return removed
+
+    def flush_arrays(self):
+        for name, _ in self._FIELDS:
+            getattr(self, name).flush()
+
+    def _flush(self):
+        self.flush_arrays()
+        meta_path = os.path.join(self.path, 'meta.json')
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'dim': self.dim, 'count': self.count, 'resume_from': self.resume_from}, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        self._unflushed = 0
+
+    def flush(self):
+        """Write the arrays and row count to disk"""
+        with self._lock:
+            self._flush()